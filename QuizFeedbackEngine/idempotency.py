@@ -0,0 +1,120 @@
+from collections import OrderedDict
+import os
+import threading
+import time
+
+
+class IdempotencyKeyConflict(Exception):
+    """The idempotency key was already used for a different request payload."""
+
+
+class IdempotencyKeyInProgress(Exception):
+    """The original request for this key is still running after the wait timeout."""
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "result", "error", "expires_at")
+
+    def __init__(self, fingerprint: str, expires_at: float):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.expires_at = expires_at
+
+
+class IdempotencyStore:
+    """Bounded, expiring store of recent results keyed by idempotency key.
+
+    `run(key, fingerprint, compute, keep)` calls `compute` once per key: a repeat after completion
+    gets the stored result, and a duplicate arriving while the original is running blocks until it
+    finishes. Failures, and results for which `keep(result)` is false, are handed to those waiting
+    duplicates but not stored, so a retry after an error recomputes.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0, wait_seconds: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _purge_expired(self, now: float):
+        # entries are ordered by expiry (fixed TTL), so expired ones sit at the front
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now:
+                break
+            self._entries.pop(key)
+
+    def _enforce_limit(self):
+        # called after a successful store only, so a failing request never evicts a good result;
+        # in-flight entries (including the one just stored) are skipped, oldest completed go first
+        excess = len(self._entries) - self.max_entries
+        if excess <= 0:
+            return
+        victims = []
+        for key, entry in self._entries.items():
+            if entry.done.is_set():
+                victims.append(key)
+                if len(victims) == excess:
+                    break
+        for key in victims:
+            self._entries.pop(key)
+
+    def _drop(self, key: str, entry: _Entry):
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def run(self, key: str, fingerprint: str, compute, keep=None):
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry.fingerprint != fingerprint:
+                raise IdempotencyKeyConflict(f"Idempotency key '{key}' was already used with a different payload")
+            owner = entry is None
+            if owner:
+                entry = _Entry(fingerprint, now + self.ttl_seconds)
+                self._entries[key] = entry
+
+        if not owner:
+            if not entry.done.wait(self.wait_seconds):
+                raise IdempotencyKeyInProgress(f"Request with idempotency key '{key}' is still being processed")
+            if entry.error is not None:
+                raise entry.error
+            return entry.result
+
+        try:
+            entry.result = compute()
+            stored = keep is None or keep(entry.result)
+        except BaseException as e:
+            entry.error = e
+            self._drop(key, entry)
+            entry.done.set()
+            raise
+        if not stored:
+            # dropped before waking: waiting duplicates still get this result, later retries recompute
+            self._drop(key, entry)
+            entry.done.set()
+            return entry.result
+        with self._lock:
+            # the TTL counts from completion; keep the dict ordered by expiry
+            entry.expires_at = time.monotonic() + self.ttl_seconds
+            if self._entries.get(key) is entry:
+                self._entries.move_to_end(key)
+            self._enforce_limit()
+        entry.done.set()
+        return entry.result
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+feedback_results = IdempotencyStore(
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600")),
+    wait_seconds=float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60")),
+)
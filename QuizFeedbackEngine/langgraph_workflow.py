@@ -1,13 +1,31 @@
 from typing import TypedDict, Annotated
-from langgraph.graph import StateGraph, END
+from collections import Counter
+from functools import lru_cache, partial
+import operator
+import threading
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 import os
 from models import Quiz
+from prompt_builder import build_feedback_prompt, normalize_title, topics_for_title
 import json
 import pathlib
 
 
+# Score-based routing: outcomes listed here get deterministic, pre-approved feedback and skip both
+# the LLM and the guardrail scan. "perfect" = all correct, "zero" = none correct,
+# "partial" = at most FEEDBACK_TEMPLATE_MAX_MISSED questions missed.
+FEEDBACK_TEMPLATE_ROUTES = {
+    r.strip() for r in os.getenv("FEEDBACK_TEMPLATE_ROUTES", "perfect,zero").split(",") if r.strip()
+}
+FEEDBACK_TEMPLATE_MAX_MISSED = int(os.getenv("FEEDBACK_TEMPLATE_MAX_MISSED", "1"))
+
+ROUTING_COUNTS = Counter()
+_routing_lock = threading.Lock()
+
+
 class QuizState(TypedDict):
     quiz: Quiz
     quizzes: list
@@ -17,15 +35,131 @@ class QuizState(TypedDict):
     total_questions: int
     question_details: list
     guardrail_check: str
+    per_quiz_summary: list
+    prompt_tokens: int
+    feedback_route: str
+    # where the feedback text came from: "llm", "template", "llm_unavailable" or "error"
+    feedback_source: str
 
 
-def analyze_quiz(state: QuizState) -> QuizState:
+class QuizFanOutState(QuizState):
+    """Top-level graph state: each per-quiz branch appends one entry to `quiz_results`."""
+    quiz_results: Annotated[list, operator.add]
+
+
+def _quizzes_from_state(state: dict) -> list:
     # Normalize input: accept either a single `quiz` or a list `quizzes`.
-    quizzes = []
     if "quizzes" in state and isinstance(state["quizzes"], list):
-        quizzes = state["quizzes"]
-    elif "quiz" in state and state["quiz"] is not None:
-        quizzes = [state["quiz"]]
+        return state["quizzes"]
+    if "quiz" in state and state["quiz"] is not None:
+        return [state["quiz"]]
+    return []
+
+
+@lru_cache(maxsize=1)
+def load_answer_key() -> dict:
+    """Load canonical answers from answers_key.json once per process.
+
+    Mapping is question_id -> correct answer index, optionally nested per quiz title.
+    The returned dict is shared and must not be mutated.
+    """
+    answers_file = pathlib.Path(__file__).resolve().parent / "answers_key.json"
+    try:
+        with open(answers_file, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except Exception:
+        # If key file missing or unreadable, fall back to empty key (no correct answers)
+        return {}
+
+
+def select_answer_map(answer_key: dict, quiz: Quiz) -> dict:
+    """Pick the {question_id: correct_index} map that applies to `quiz`."""
+    # Determine whether the answers file contains per-quiz objects (nested dicts)
+    nested_answers = isinstance(answer_key, dict) and any(isinstance(v, dict) for v in answer_key.values())
+    # If answers are flat, just return them
+    if not nested_answers:
+        return answer_key
+
+    # Try to match by normalized title (prefer exact normalized equality, then substring)
+    title_norm = normalize_title(quiz.title or "")
+    # 1) exact normalized match
+    for k, v in answer_key.items():
+        if not isinstance(v, dict):
+            continue
+        if title_norm and normalize_title(k) == title_norm:
+            return v
+
+    # 2) substring match (either direction)
+    for k, v in answer_key.items():
+        if not isinstance(v, dict):
+            continue
+        k_norm = normalize_title(k)
+        if title_norm and (k_norm in title_norm or title_norm in k_norm):
+            return v
+
+    # 3) If no title match, pick the first mapping that contains any of the question ids
+    for k, v in answer_key.items():
+        if not isinstance(v, dict):
+            continue
+        for qobj in quiz.questions:
+            if str(qobj.id) in v:
+                return v
+
+    # 4) Fallback: merge all nested maps into one
+    merged = {}
+    for v in answer_key.values():
+        if isinstance(v, dict):
+            merged.update(v)
+    return merged
+
+
+def analyze_single_quiz(quiz: Quiz, answer_key: dict) -> dict:
+    """Analyze one Quiz object against the answer_key.
+
+    Returns a dict with keys: title, total_questions, score, question_details, analysis
+    """
+    correct_count = 0
+    question_details = []
+
+    for question in quiz.questions:
+        qid = str(question.id)
+        correct_index = answer_key.get(qid)
+        user_ans = question.user_answer
+        is_correct = (user_ans is not None and correct_index is not None and user_ans == correct_index)
+        if is_correct:
+            correct_count += 1
+
+        question_details.append({
+            "question_id": question.id,
+            "user_answer": user_ans if user_ans is not None else "No answer",
+            "correct_answer_index": correct_index if correct_index is not None else "Unknown",
+            "is_correct": is_correct
+        })
+
+    analysis = f"Quiz: {quiz.title}\n"
+    analysis += f"Total Questions: {len(quiz.questions)}\n"
+    analysis += f"Correct Answers: {correct_count}\n"
+    analysis += f"Score: {correct_count}/{len(quiz.questions)}\n\n"
+    analysis += "Question Details:\n"
+    for detail in question_details:
+        status = "✓ Correct" if detail["is_correct"] else "✗ Incorrect"
+        analysis += f"Q{detail['question_id']}: {status}\n"
+        analysis += f"  Your answer: {detail['user_answer']}\n"
+        if not detail["is_correct"]:
+            ca = detail.get('correct_answer_index', 'Unknown')
+            analysis += f"  Correct answer index: {ca}\n"
+
+    return {
+        "title": quiz.title,
+        "total_questions": len(quiz.questions),
+        "score": correct_count,
+        "question_details": question_details,
+        "analysis": analysis,
+    }
+
+
+def analyze_quiz(state: QuizState) -> QuizState:
+    quizzes = _quizzes_from_state(state)
 
     if not quizzes:
         state["analysis"] = "Error: no quiz provided"
@@ -35,58 +169,7 @@ def analyze_quiz(state: QuizState) -> QuizState:
         state["per_quiz_summary"] = []
         return state
 
-    # Load canonical answers from answers_key.json (mapping question_id -> correct answer index)
-    answers_file = pathlib.Path(__file__).resolve().parent / "answers_key.json"
-    try:
-        with open(answers_file, "r", encoding="utf-8") as fh:
-            answer_key = json.load(fh)
-    except Exception:
-        # If key file missing or unreadable, fall back to empty key (no correct answers)
-        answer_key = {}
-
-    def analyze_single_quiz(quiz: Quiz, answer_key: dict) -> dict:
-        """Analyze one Quiz object against the answer_key.
-
-        Returns a dict with keys: title, total_questions, score, question_details, analysis
-        """
-        correct_count = 0
-        question_details = []
-
-        for question in quiz.questions:
-            qid = str(question.id)
-            correct_index = answer_key.get(qid)
-            user_ans = question.user_answer
-            is_correct = (user_ans is not None and correct_index is not None and user_ans == correct_index)
-            if is_correct:
-                correct_count += 1
-
-            question_details.append({
-                "question_id": question.id,
-                "user_answer": user_ans if user_ans is not None else "No answer",
-                "correct_answer_index": correct_index if correct_index is not None else "Unknown",
-                "is_correct": is_correct
-            })
-
-        analysis = f"Quiz: {quiz.title}\n"
-        analysis += f"Total Questions: {len(quiz.questions)}\n"
-        analysis += f"Correct Answers: {correct_count}\n"
-        analysis += f"Score: {correct_count}/{len(quiz.questions)}\n\n"
-        analysis += "Question Details:\n"
-        for detail in question_details:
-            status = "✓ Correct" if detail["is_correct"] else "✗ Incorrect"
-            analysis += f"Q{detail['question_id']}: {status}\n"
-            analysis += f"  Your answer: {detail['user_answer']}\n"
-            if not detail["is_correct"]:
-                ca = detail.get('correct_answer_index', 'Unknown')
-                analysis += f"  Correct answer index: {ca}\n"
-
-        return {
-            "title": quiz.title,
-            "total_questions": len(quiz.questions),
-            "score": correct_count,
-            "question_details": question_details,
-            "analysis": analysis,
-        }
+    answer_key = load_answer_key()
 
     total_questions = 0
     total_correct = 0
@@ -94,52 +177,8 @@ def analyze_quiz(state: QuizState) -> QuizState:
     per_quiz_summary = []
     combined_analysis_parts = []
 
-    # Determine whether the answers file contains per-quiz objects (nested dicts)
-    nested_answers = False
-    if isinstance(answer_key, dict):
-        nested_answers = any(isinstance(v, dict) for v in answer_key.values())
-
-    def _select_answer_map_for_quiz(quiz: Quiz):
-        # If answers are flat, just return them
-        if not nested_answers:
-            return answer_key
-        # Try to match by normalized title (prefer exact normalized equality, then substring)
-        def normalize(s: str) -> str:
-            return ''.join(ch for ch in (s or "").lower() if ch.isalnum())
-
-        title_norm = normalize(quiz.title or "")
-        # 1) exact normalized match
-        for k, v in answer_key.items():
-            if not isinstance(v, dict):
-                continue
-            if title_norm and normalize(k) == title_norm:
-                return v
-
-        # 2) substring match (either direction)
-        for k, v in answer_key.items():
-            if not isinstance(v, dict):
-                continue
-            k_norm = normalize(k)
-            if title_norm and (k_norm in title_norm or title_norm in k_norm):
-                return v
-
-        # 3) If no title match, pick the first mapping that contains any of the question ids
-        for k, v in answer_key.items():
-            if not isinstance(v, dict):
-                continue
-            for qobj in quiz.questions:
-                if str(qobj.id) in v:
-                    return v
-
-        # 4) Fallback: merge all nested maps into one
-        merged = {}
-        for v in answer_key.values():
-            if isinstance(v, dict):
-                merged.update(v)
-        return merged
-
     for qi, q in enumerate(quizzes, start=1):
-        quiz_answer_map = _select_answer_map_for_quiz(q)
+        quiz_answer_map = select_answer_map(answer_key, q)
         single = analyze_single_quiz(q, quiz_answer_map)
         # attach quiz index to each question detail for traceability
         for d in single["question_details"]:
@@ -214,158 +253,70 @@ def apply_guardrails(state: QuizState) -> QuizState:
     return state
 
 
+def deterministic_feedback(state: QuizState) -> str:
+    """Fixed feedback sentences: a short celebration if all correct, otherwise score, up to two
+    review topics (from `topics_by_quiz.json` for each missed question's quiz) and encouragement.
+
+    Used when no LLM is configured and by the template route.
+    """
+    total = state["total_questions"]
+    score = state["score"]
+    if score == total:
+        return f"Excellent — all {total} answers are correct. Well done!"
+
+    summaries = state.get("per_quiz_summary") or []
+    if not summaries:
+        quiz = state.get("quiz")
+        summaries = [{"title": getattr(quiz, "title", None), "question_details": state.get("question_details", [])}]
+
+    # up to two review topics from the missed questions, in question order
+    suggested = []
+    for summary in summaries:
+        topic_map = topics_for_title(summary["title"])
+        for d in summary["question_details"]:
+            topic = topic_map.get(d["question_id"])
+            if not d["is_correct"] and topic and topic not in suggested:
+                suggested.append(topic)
+
+    sentence1 = f"Score: {score}/{total}."
+    if suggested:
+        sentence2 = f"Review: {', '.join(suggested[:2])}."
+    else:
+        sentence2 = "Review the topics you missed."
+    if score == 0:
+        sentence3 = "Every attempt builds understanding, so try again after reviewing the concepts."
+    else:
+        sentence3 = "Try again after reviewing the concepts."
+    return " ".join([sentence1, sentence2, sentence3])
+
+
 def generate_feedback(state: QuizState) -> QuizState:
     if state["total_questions"] == 0:
         state["feedback"] = "Error: Cannot generate feedback for a quiz with no questions."
+        state["feedback_source"] = "error"
         return state
     
     api_key = os.getenv("OPENROUTER_API_KEY", "YOUR_OPENROUTER_API_KEY_HERE")
     
     if api_key == "YOUR_OPENROUTER_API_KEY_HERE" or not api_key:
-        # concise fallback behavior: short celebration if all correct, otherwise 2-3 short sentences
-        total = state['total_questions']
-        score = state['score']
-
-        # Try to load per-quiz topic maps from topics_by_quiz.json; fall back to an inline map if missing.
-        topics_file = pathlib.Path(__file__).resolve().parent / "topics_by_quiz.json"
-        try:
-            with open(topics_file, "r", encoding="utf-8") as fh:
-                topics_by_quiz = json.load(fh)
-        except Exception:
-            topics_by_quiz = None
-
-        # Helper to normalize titles for matching
-        def normalize(s: str) -> str:
-            return ''.join(ch for ch in (s or "").lower() if ch.isalnum())
-
-        # Select topic maps per-quiz by matching the quiz title included in the incoming request.
-        # Build a mapping: quiz_index -> { question_id: topic }
-        quiz_topics = {}
-
-        def select_topic_map_by_title(title: str):
-            title_norm = normalize(title)
-            if not isinstance(topics_by_quiz, dict):
-                return {}
-            # if nested per-quiz maps
-            if any(isinstance(v, dict) for v in topics_by_quiz.values()):
-                # 1) exact normalized match
-                for k, v in topics_by_quiz.items():
-                    if not isinstance(v, dict):
-                        continue
-                    if title_norm and normalize(k) == title_norm:
-                        return {int(k2): str(v2) for k2, v2 in v.items()}
-                # 2) substring match
-                for k, v in topics_by_quiz.items():
-                    if not isinstance(v, dict):
-                        continue
-                    k_norm = normalize(k)
-                    if title_norm and (k_norm in title_norm or title_norm in k_norm):
-                        return {int(k2): str(v2) for k2, v2 in v.items()}
-                # 3) no match
-                return {}
-            else:
-                # flat mapping
-                try:
-                    return {int(k): str(v) for k, v in topics_by_quiz.items()}
-                except Exception:
-                    return {}
-
-        # prefer explicit quizzes list in state; otherwise use single quiz title
-        if "quizzes" in state and isinstance(state["quizzes"], list):
-            for idx, quiz_obj in enumerate(state["quizzes"], start=1):
-                title = None
-                if hasattr(quiz_obj, "title"):
-                    title = getattr(quiz_obj, "title")
-                elif isinstance(quiz_obj, dict):
-                    title = quiz_obj.get("title")
-                quiz_topics[idx] = select_topic_map_by_title(title)
-        elif "quiz" in state and state["quiz"] is not None:
-            qobj = state["quiz"]
-            title = getattr(qobj, "title") if hasattr(qobj, "title") else (qobj.get("title") if isinstance(qobj, dict) else None)
-            quiz_topics[1] = select_topic_map_by_title(title)
-
-        def default_topics():
-            return {
-                1: "conservation of momentum",
-                2: "elastic collisions and kinetic energy conservation",
-                3: "energy dissipation (heat & deformation)",
-                4: "effects of mass ratio in collisions",
-                5: "coefficient of restitution and velocity ratios",
-            }
-
-        if score == total:
-            # very short celebration (English)
-            state["feedback"] = f"Excellent — all {total} answers are correct. Well done!"
-            return state
-
-        # otherwise build 2-3 short sentences
-        incorrect = [d for d in state['question_details'] if not d['is_correct']]
-        missed_ids = [str(d['question_id']) for d in incorrect]
-        # gather unique topic suggestions; select topic by the question's quiz_index to avoid mixing
-        suggested = []
-        for d in incorrect:
-            tid = d['question_id']
-            qidx = d.get('quiz_index', 1)
-            topic_map_for_quiz = quiz_topics.get(qidx) or {}
-            topic = topic_map_for_quiz.get(tid)
-            if not topic:
-                topic = default_topics().get(tid)
-            if topic and topic not in suggested:
-                suggested.append(topic)
-
-        sentence1 = f"Score: {score}/{total}."
-        if suggested:
-            # join 1-2 main topics for brevity
-            top_suggestions = ", ".join(suggested[:2])
-            sentence2 = f"Review: {top_suggestions}."
-        else:
-            sentence2 = "Review the topics you missed."
-        sentence3 = "Try again after reviewing the concepts."
-
-        state["feedback"] = " ".join([sentence1, sentence2, sentence3])
+        # no LLM configured: the same fixed sentences as the template route
+        state["feedback"] = deterministic_feedback(state)
+        state["feedback_source"] = "template"
         return state
     
+    # OPENROUTER_BASE_URL lets load tests point at a local OpenAI-compatible stub (see stub_openrouter.py)
     llm = ChatOpenAI(
-        base_url="https://openrouter.ai/api/v1",
+        base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
         api_key=api_key,
-        model="meta-llama/llama-3.2-3b-instruct:free",
-        temperature=0.7
+        model=os.getenv("OPENROUTER_MODEL", "meta-llama/llama-3.2-3b-instruct:free"),
+        temperature=0.7,
+        max_retries=int(os.getenv("OPENROUTER_MAX_RETRIES", "2")),
+        streaming=os.getenv("OPENROUTER_STREAMING", "0").lower() in ("1", "true", "yes")
     )
     
-    system_prompt = """You are a concise educational tutor. Provide feedback in 2-3 short sentences.
-If all answers are correct, reply with a single short celebratory sentence (e.g. "Excellent — all answers are correct!").
-If there are incorrect answers, briefly state the score, name up to two key topics to review (based on the provided mapping), and finish with a short encouraging sentence.
-Always use a positive, supportive tone and keep replies very short.
-Responses MUST be in ENGLISH.
-"""
-
-    # Provide the analysis and a mapping from question IDs to suggested review topics so the model can reference them.
-    topic_map_lines = []
-    topic_map = {
-        1: "conservation of momentum",
-        2: "elastic collisions and conservation of kinetic energy",
-        3: "energy dissipation (heat & deformation)",
-        4: "effects of mass ratio in collisions",
-        5: "coefficient of restitution and velocity ratios",
-    }
-    for k, v in topic_map.items():
-        topic_map_lines.append(f"Q{k}: {v}")
-
-    user_prompt = f"""Please provide concise feedback for this quiz submission (2-3 short sentences).
+    system_prompt, user_prompt, prompt_tokens = build_feedback_prompt(state)
+    state["prompt_tokens"] = prompt_tokens
 
-Quiz analysis:
-{state['analysis']}
-
-If there are incorrect answers, use the mapping below to suggest topics to review (choose up to two):
-{chr(10).join(topic_map_lines)}
-
-Rules:
-- If all answers are correct: return a single short celebratory sentence.
-- If some answers are incorrect: mention the score in one short sentence, suggest up to two topics in one short sentence, and finish with a short encouraging sentence.
-
-RESPONSES MUST BE IN ENGLISH.
-"""
-    
     try:
         messages = [
             SystemMessage(content=system_prompt),
@@ -374,26 +325,184 @@ RESPONSES MUST BE IN ENGLISH.
         
         response = llm.invoke(messages)
         state["feedback"] = str(response.content)
+        state["feedback_source"] = "llm"
+        # Prefer the provider-reported count over our estimate when it is available
+        usage = getattr(response, "usage_metadata", None) or {}
+        if usage.get("input_tokens"):
+            state["prompt_tokens"] = usage["input_tokens"]
     except Exception:
         # Do not expose internal error details to the frontend. Provide a friendly fallback message
         # and include the quiz analysis so the user still sees results.
         state["feedback"] = "Our AI isn't available at the moment — here are your quiz results:\n\n" + state.get('analysis', 'No analysis available.')
-    
+        state["feedback_source"] = "llm_unavailable"
+
     return state
 
 
-def create_quiz_feedback_workflow():
+def _feedback_route(state: QuizState) -> str:
+    total = state["total_questions"]
+    score = state["score"]
+    if total == 0:
+        return "generate"
+    if score == total and "perfect" in FEEDBACK_TEMPLATE_ROUTES:
+        return "perfect"
+    if score == 0 and "zero" in FEEDBACK_TEMPLATE_ROUTES:
+        return "zero"
+    if 0 < score < total and total - score <= FEEDBACK_TEMPLATE_MAX_MISSED and "partial" in FEEDBACK_TEMPLATE_ROUTES:
+        return "partial"
+    return "generate"
+
+
+def route_feedback(state: QuizState) -> str:
+    """Conditional edge after analysis: template-able outcomes skip the LLM and guardrails."""
+    route = _feedback_route(state)
+    with _routing_lock:
+        ROUTING_COUNTS[route] += 1
+    return "generate_feedback" if route == "generate" else "template_feedback"
+
+
+def routing_stats() -> dict:
+    with _routing_lock:
+        return dict(ROUTING_COUNTS)
+
+
+def template_feedback(state: QuizState) -> QuizState:
+    """Deterministic feedback from fixed, pre-approved sentences (no LLM call, no guardrail scan)."""
+    state["feedback_route"] = _feedback_route(state)
+    state["feedback"] = deterministic_feedback(state)
+    state["feedback_source"] = "template"
+    state["guardrail_check"] = "APPROVED"
+    return state
+
+
+def fan_out_quizzes(state: QuizFanOutState):
+    """Send each quiz to its own branch; with no quizzes go straight to the merge step."""
+    quizzes = _quizzes_from_state(state)
+    if not quizzes:
+        return "merge"
+    return [Send("quiz_branch", {"quiz": q, "quiz_index": qi}) for qi, q in enumerate(quizzes, start=1)]
+
+
+def run_quiz_branch(branch_graph, branch: dict) -> dict:
+    """Grade, generate feedback for and guardrail-check a single quiz."""
+    quiz = branch["quiz"]
+    qi = branch["quiz_index"]
+    result = branch_graph.invoke({
+        "quiz": quiz,
+        "analysis": "",
+        "feedback": "",
+        "score": 0,
+        "total_questions": len(quiz.questions),
+        "question_details": [],
+        "guardrail_check": ""
+    })
+    for d in result["question_details"]:
+        d["quiz_index"] = qi
+    return {"quiz_results": [{
+        "quiz_index": qi,
+        "title": quiz.title,
+        "total_questions": result["total_questions"],
+        "score": result["score"],
+        "analysis": result["analysis"],
+        "question_details": result["question_details"],
+        "feedback": result["feedback"],
+        "guardrail_check": result["guardrail_check"],
+        "prompt_tokens": result.get("prompt_tokens"),
+        "feedback_route": result.get("feedback_route", "generate"),
+        "feedback_source": result.get("feedback_source", "error"),
+    }]}
+
+
+def merge_quiz_results(state: QuizFanOutState) -> dict:
+    """Reduce per-quiz branch results into the combined score, feedback and `per_quiz_summary`."""
+    results = sorted(state.get("quiz_results") or [], key=lambda r: r["quiz_index"])
+    if not results:
+        return {
+            "analysis": "Error: no quiz provided",
+            "score": 0,
+            "total_questions": 0,
+            "question_details": [],
+            "per_quiz_summary": [],
+            "feedback": "Error: Cannot generate feedback for a quiz with no questions.",
+            "feedback_source": "error",
+            "guardrail_check": "APPROVED"
+        }
+
+    if len(results) == 1:
+        feedback = results[0]["feedback"]
+    else:
+        feedback = "\n\n".join(f"{r['title']}: {r['feedback']}" for r in results)
+
+    checks = [r["guardrail_check"] for r in results]
+    blocked = [c for c in checks if c.startswith("BLOCKED")]
+    warnings = [c for c in checks if c.startswith("WARNING")]
+    if blocked:
+        guardrail_check = "; ".join(blocked)
+    elif warnings:
+        guardrail_check = warnings[0]
+    else:
+        guardrail_check = "APPROVED"
+
+    # the least reusable source wins: any failed quiz marks the combined feedback as failed
+    sources = {r["feedback_source"] for r in results}
+    for feedback_source in ("error", "llm_unavailable", "llm", "template"):
+        if feedback_source in sources:
+            break
+
+    token_counts = [r["prompt_tokens"] for r in results if r.get("prompt_tokens") is not None]
+
+    update = {
+        "analysis": "\n\n--- Per-quiz analysis ---\n\n".join(r["analysis"] for r in results),
+        "score": sum(r["score"] for r in results),
+        "total_questions": sum(r["total_questions"] for r in results),
+        "question_details": [d for r in results for d in r["question_details"]],
+        "per_quiz_summary": [{k: v for k, v in r.items() if k != "quiz_index"} for r in results],
+        "feedback": feedback,
+        "guardrail_check": guardrail_check,
+        "feedback_source": feedback_source
+    }
+    if token_counts:
+        update["prompt_tokens"] = sum(token_counts)
+    return update
+
+
+def create_quiz_branch_workflow():
+    """Per-quiz pipeline run inside each fan-out branch.
+
+    analyze -> generate_feedback -> guardrails, or analyze -> template_feedback when
+    `route_feedback` decides the outcome does not need the LLM.
+    """
     workflow = StateGraph(QuizState)
-    
+
     workflow.add_node("analyze", analyze_quiz)
     workflow.add_node("generate_feedback", generate_feedback)
     workflow.add_node("guardrails", apply_guardrails)
-    
+
+    workflow.add_node("template_feedback", template_feedback)
+
     workflow.set_entry_point("analyze")
-    workflow.add_edge("analyze", "generate_feedback")
+    workflow.add_conditional_edges("analyze", route_feedback, ["generate_feedback", "template_feedback"])
     workflow.add_edge("generate_feedback", "guardrails")
     workflow.add_edge("guardrails", END)
-    
+    workflow.add_edge("template_feedback", END)
+
+    return workflow.compile()
+
+
+def create_quiz_feedback_workflow():
+    # Map/reduce over quizzes: every quiz runs its branch concurrently (one superstep),
+    # so multi-quiz latency tracks the slowest quiz rather than the sum.
+    branch_graph = create_quiz_branch_workflow()
+
+    workflow = StateGraph(QuizFanOutState)
+
+    workflow.add_node("quiz_branch", partial(run_quiz_branch, branch_graph))
+    workflow.add_node("merge", merge_quiz_results)
+
+    workflow.add_conditional_edges(START, fan_out_quizzes, ["quiz_branch", "merge"])
+    workflow.add_edge("quiz_branch", "merge")
+    workflow.add_edge("merge", END)
+
     return workflow.compile()
 
 
@@ -0,0 +1,243 @@
+"""End-to-end load test for the feedback service against a local OpenRouter stub.
+
+Starts `stub_openrouter.py` and the FastAPI service (`main:app`) as subprocesses, points the
+service's LLM client at the stub via OPENROUTER_BASE_URL, then sends open-loop (Poisson) traffic
+of compact `QuizAttempt` submissions at a fixed rate and reports throughput and p50/p95/p99
+latency per endpoint.
+
+The service answers a failed LLM call with HTTP 200 and a results-only fallback, so those responses
+are counted in their own "fallbk" column (`feedback_source == "llm_unavailable"`). The spawned service
+runs with `--llm-retries` (default 0) so each injected stub error shows up there instead of being
+hidden by a retry.
+
+Usage:
+    python loadtest.py --rate 20 --duration 30 --stub-latency lognormal:400:0.5 --stub-error-rate 0.02
+    python loadtest.py --target http://127.0.0.1:5000 --rate 5   # drive an already-running service
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import pathlib
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+BASE_DIR = pathlib.Path(__file__).resolve().parent
+
+
+def load_answer_key() -> dict:
+    with open(BASE_DIR / "answers_key.json", "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def make_attempt(answer_key: dict, p_correct: float) -> dict:
+    """A compact attempt for a random quiz; each answer is correct with probability `p_correct`."""
+    title = random.choice(list(answer_key))
+    answers = []
+    for qid, correct in answer_key[title].items():
+        if random.random() < p_correct:
+            user_answer = correct
+        else:
+            user_answer = random.choice([i for i in range(4) if i != correct])
+        answers.append({"question_id": int(qid), "user_answer": user_answer})
+    return {"title": title, "answers": answers}
+
+
+def make_request(endpoint: str, answer_key: dict, p_correct: float):
+    """Return (method, path, json_body) for one request to `endpoint`."""
+    if endpoint == "/health":
+        return "GET", endpoint, None
+    attempt = make_attempt(answer_key, p_correct)
+    if endpoint == "/feedback/analyze-only":
+        questions = [{"id": a["question_id"], "user_answer": a["user_answer"]} for a in attempt["answers"]]
+        return "POST", endpoint, {"quiz": {"title": attempt["title"], "questions": questions}}
+    return "POST", endpoint, attempt
+
+
+def parse_mix(spec: str) -> dict:
+    """'/feedback=8,/health=1' -> {'/feedback': 8.0, '/health': 1.0}"""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if not name.startswith("/"):
+            name = "/" + name
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def is_fallback(resp: httpx.Response) -> bool:
+    """True for a 200 carrying the "AI unavailable" fallback instead of LLM feedback."""
+    try:
+        body = resp.json()
+    except ValueError:
+        return False
+    return isinstance(body, dict) and body.get("feedback_source") == "llm_unavailable"
+
+
+async def run_load(target: str, rate: float, duration: float, mix: dict, max_in_flight: int,
+                   p_correct: float, timeout: float) -> dict:
+    answer_key = load_answer_key()
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+    results = {e: {"latencies": [], "errors": 0, "fallbacks": 0, "status": {}} for e in endpoints}
+    limiter = asyncio.Semaphore(max_in_flight)
+    dropped = 0
+
+    async def one(client: httpx.AsyncClient, endpoint: str):
+        method, path, body = make_request(endpoint, answer_key, p_correct)
+        stats = results[endpoint]
+        start = time.perf_counter()
+        fallback = False
+        try:
+            resp = await client.request(method, path, json=body)
+            code = str(resp.status_code)
+            ok = resp.status_code < 400
+            if ok and endpoint.startswith("/feedback"):
+                fallback = is_fallback(resp)
+        except httpx.HTTPError as e:
+            code = type(e).__name__
+            ok = False
+        finally:
+            limiter.release()
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        stats["status"][code] = stats["status"].get(code, 0) + 1
+        if ok:
+            stats["latencies"].append(elapsed_ms)
+            stats["fallbacks"] += fallback
+        else:
+            stats["errors"] += 1
+
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=target, timeout=timeout, limits=limits) as client:
+        tasks = []
+        started = time.perf_counter()
+        next_at = started
+        while next_at - started < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # open loop: never wait for a slot, count the arrival as dropped instead
+            if limiter.locked():
+                dropped += 1
+            else:
+                await limiter.acquire()
+                endpoint = random.choices(endpoints, weights)[0]
+                tasks.append(asyncio.create_task(one(client, endpoint)))
+            next_at += random.expovariate(rate)
+        send_window = time.perf_counter() - started
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - started
+
+    return {"results": results, "dropped": dropped, "send_window": send_window, "wall": wall}
+
+
+def print_report(report: dict):
+    print(f"\nwall time {report['wall']:.1f}s (sending for {report['send_window']:.1f}s), "
+          f"dropped arrivals (in-flight cap): {report['dropped']}")
+    header = f"{'endpoint':<26}{'ok':>7}{'fallbk':>8}{'err':>6}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, stats in report["results"].items():
+        lat = sorted(stats["latencies"])
+        rps = len(lat) / report["wall"] if report["wall"] else 0.0
+        print(f"{endpoint:<26}{len(lat):>7}{stats['fallbacks']:>8}{stats['errors']:>6}{rps:>8.1f}"
+              f"{percentile(lat, 50):>10.1f}{percentile(lat, 95):>10.1f}{percentile(lat, 99):>10.1f}"
+              f"{(lat[-1] if lat else float('nan')):>10.1f}")
+        if stats["errors"]:
+            print(f"{'':<26}status counts: {stats['status']}")
+
+
+def wait_until_up(url: str, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"process for {url} exited with code {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=10.0, help="mean arrival rate, requests/second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of traffic to send")
+    parser.add_argument("--mix", default="/feedback=8,/feedback/analyze-only=1,/health=1",
+                        help="endpoint weights, e.g. /feedback=8,/health=1")
+    parser.add_argument("--max-in-flight", type=int, default=200, help="cap on concurrent requests")
+    parser.add_argument("--p-correct", type=float, default=0.6, help="probability each answer is correct")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout, seconds")
+    parser.add_argument("--target", help="URL of an already-running service; skips spawning processes")
+    parser.add_argument("--service-port", type=int, default=5055)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the service")
+    parser.add_argument("--stub-port", type=int, default=8089)
+    parser.add_argument("--stub-latency", default="lognormal:400:0.5", help="see stub_openrouter.py")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-token-ms", type=float, default=15.0)
+    parser.add_argument("--stream", action="store_true", help="have the service request streamed completions")
+    parser.add_argument("--llm-retries", type=int, default=0,
+                        help="LLM client retries in the spawned service (service default 2)")
+    args = parser.parse_args()
+
+    procs = []
+    target = args.target
+    try:
+        if not target:
+            stub = subprocess.Popen(
+                [sys.executable, "stub_openrouter.py", "--port", str(args.stub_port),
+                 "--latency", args.stub_latency, "--error-rate", str(args.stub_error_rate),
+                 "--token-ms", str(args.stub_token_ms)],
+                cwd=BASE_DIR,
+            )
+            procs.append(stub)
+            wait_until_up(f"http://127.0.0.1:{args.stub_port}/v1/models", stub)
+
+            env = dict(os.environ)
+            env.update(
+                OPENROUTER_API_KEY="stub-key",
+                OPENROUTER_BASE_URL=f"http://127.0.0.1:{args.stub_port}/v1",
+                OPENROUTER_STREAMING="1" if args.stream else "0",
+                OPENROUTER_MAX_RETRIES=str(args.llm_retries),
+            )
+            service = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                 "--port", str(args.service_port), "--workers", str(args.workers), "--log-level", "warning"],
+                cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL,
+            )
+            procs.append(service)
+            target = f"http://127.0.0.1:{args.service_port}"
+            wait_until_up(f"{target}/health", service)
+
+        print(f"driving {target} at {args.rate:.1f} req/s for {args.duration:.0f}s, mix {args.mix}")
+        report = asyncio.run(run_load(target, args.rate, args.duration, parse_mix(args.mix),
+                                      args.max_in_flight, args.p_correct, args.timeout))
+        print_report(report)
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
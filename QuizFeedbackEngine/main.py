@@ -1,19 +1,30 @@
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from models import QuizSubmission, FeedbackResponse, Quiz, QuizAttempt
-from langgraph_workflow import quiz_feedback_graph
-from mock_data import MOCK_QUIZ, MOCK_QUIZ_2
-from copy import deepcopy
+from models import QuizSubmission, FeedbackResponse, FeedbackRequest, Quiz, Question, AnswerSubmission, ProfilingSettings
+from pydantic import ValidationError
+from langgraph_workflow import quiz_feedback_graph, routing_stats
+from mock_data import MOCK_QUIZ, MOCK_QUIZ_2, mock_quiz_for_title
+from idempotency import feedback_results, IdempotencyKeyConflict, IdempotencyKeyInProgress
+from quiz_session import QuizSession, REUSABLE_SOURCES
+from profiling import ProfiledRoute, current_profile, get_config as get_profiling_config, configure as configure_profiling
+from typing import Optional
+import json
 import os
 
 from dotenv import load_dotenv
 load_dotenv()  # reads .env into os.environ
 
+# The /debug/profiling routes are off unless PROFILE_ADMIN is set, and then only answer loopback clients.
+PROFILING_ADMIN = os.getenv("PROFILE_ADMIN", "0").lower() in ("1", "true", "yes")
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
 app = FastAPI(
     title="Test Feedback Service",
     description="A test feedback system based on LangGraph with LLM integration",
     version="1.0.0"
 )
+# every HTTP route is profiled end to end (parsing, endpoint, serialization) when profiling is on
+app.router.route_class = ProfiledRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -33,7 +44,9 @@ def read_root():
             "POST /feedback": "Submit a test for feedback",
             "GET /mock-quiz": "Get mock quiz data",
             "GET /mock-quiz-2": "Get second mock quiz",
-            "GET /health": "Health check"
+            "GET /health": "Health check",
+            "WS /ws/quiz-session": "Incremental quiz session with feedback prefetch",
+            "GET|POST /debug/profiling": "Inspect or change request profiling settings (PROFILE_ADMIN, localhost only)"
         },
         "openrouter_configured": os.getenv("OPENROUTER_API_KEY") is not None
     }
@@ -43,7 +56,8 @@ def read_root():
 def health_check():
     return {
         "status": "healthy",
-        "openrouter_api_configured": os.getenv("OPENROUTER_API_KEY") is not None
+        "openrouter_api_configured": os.getenv("OPENROUTER_API_KEY") is not None,
+        "feedback_routing": routing_stats()
     }
 
 
@@ -57,62 +71,83 @@ def get_mock_quiz_2():
     return MOCK_QUIZ_2
 
 
+def _quiz_from_payload(payload: FeedbackRequest) -> Quiz:
+    # Full submission shape: already validated, use it directly
+    if isinstance(payload, QuizSubmission):
+        return payload.quiz
+
+    # Compact attempt shape: choose base quiz by title if provided, otherwise default to MOCK_QUIZ
+    attempt = payload
+    base = mock_quiz_for_title(attempt.title)
+
+    # Build a fresh Quiz (the mock data is never mutated). Fields are already validated,
+    # so model_construct skips a second validation pass.
+    answers = {ans.question_id: ans.user_answer for ans in attempt.answers}
+    return Quiz.model_construct(
+        # keep the client's title so grading and topic lookup use the right quiz
+        title=attempt.title or base.title,
+        questions=[
+            Question.model_construct(id=q.id, user_answer=answers.get(q.id, q.user_answer))
+            for q in base.questions
+        ],
+    )
+
+
+def _run_feedback(quiz_obj: Quiz) -> FeedbackResponse:
+    initial_state = {
+        "quiz": quiz_obj,
+        "analysis": "",
+        "feedback": "",
+        "score": 0,
+        "total_questions": len(quiz_obj.questions),
+        "question_details": [],
+        "guardrail_check": ""
+    }
+
+    result = quiz_feedback_graph.invoke(initial_state)
+
+    return FeedbackResponse(
+        overall_score=result["score"],
+        total_questions=result["total_questions"],
+        feedback=result["feedback"],
+        question_feedback=result["question_details"],
+        prompt_tokens=result.get("prompt_tokens"),
+        feedback_source=result.get("feedback_source")
+    )
+
+
 @app.post("/feedback", response_model=FeedbackResponse)
-def get_quiz_feedback(payload: dict = Body(...)):
+def get_quiz_feedback(payload: FeedbackRequest, idempotency_key: Optional[str] = Header(None)):
     """Accept either the full `QuizSubmission` shape {"quiz": {..}} or the compact shape
     {"title": "...", "answers": [{"question_id": 1, "user_answer": 2}, ...] }.
     If the compact shape is received, we expand it using the mock quiz data.
+    Malformed bodies are rejected with 422 before the handler runs.
+
+    Retries are deduplicated by the `Idempotency-Key` header or the payload's `attempt_id`:
+    a repeat gets the stored response and a duplicate sent while the original is still
+    running waits for it instead of invoking the graph (and the LLM) again. Only LLM and
+    template feedback is stored; a retry after the "AI unavailable" fallback runs again.
     """
+    key = idempotency_key or payload.attempt_id
     try:
-        # If the client sent the full submission shape, validate and use it directly
-        if "quiz" in payload:
-            submission = QuizSubmission.parse_obj(payload)
-            quiz_obj = submission.quiz
-        else:
-            # expect compact attempt shape (title + answers)
-            attempt = QuizAttempt.parse_obj(payload)
-
-            # choose base quiz by title if provided, otherwise default to MOCK_QUIZ
-            if attempt.title:
-                if attempt.title == MOCK_QUIZ.title:
-                    base = MOCK_QUIZ
-                elif attempt.title == MOCK_QUIZ_2.title:
-                    base = MOCK_QUIZ_2
-                else:
-                    base = MOCK_QUIZ
-            else:
-                base = MOCK_QUIZ
-
-            # deep copy so we don't mutate the original mock data
-            quiz_copy: Quiz = deepcopy(base)
-
-            # map question id -> index in quiz_copy.questions
-            qmap = {q.id: idx for idx, q in enumerate(quiz_copy.questions)}
-
-            for ans in attempt.answers:
-                if ans.question_id in qmap:
-                    quiz_copy.questions[qmap[ans.question_id]].user_answer = ans.user_answer
-
-            quiz_obj = quiz_copy
-
-        initial_state = {
-            "quiz": quiz_obj,
-            "analysis": "",
-            "feedback": "",
-            "score": 0,
-            "total_questions": len(quiz_obj.questions),
-            "question_details": [],
-            "guardrail_check": ""
-        }
+        quiz_obj = _quiz_from_payload(payload)
 
-        result = quiz_feedback_graph.invoke(initial_state)
+        profile = current_profile()
+        if profile is not None:
+            profile.update(title=quiz_obj.title, questions=len(quiz_obj.questions),
+                           shape="submission" if isinstance(payload, QuizSubmission) else "attempt",
+                           idempotent=bool(key),
+                           llm_configured=os.getenv("OPENROUTER_API_KEY") is not None)
 
-        return FeedbackResponse(
-            overall_score=result["score"],
-            total_questions=result["total_questions"],
-            feedback=result["feedback"],
-            question_feedback=result["question_details"]
-        )
+        if not key:
+            return _run_feedback(quiz_obj)
+        # LLM-outage fallbacks are not stored, so pressing Submit again retries the LLM
+        return feedback_results.run(str(key), quiz_obj.model_dump_json(), lambda: _run_feedback(quiz_obj),
+                                    keep=lambda response: response.feedback_source in REUSABLE_SOURCES)
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyKeyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing quiz: {str(e)}")
 
@@ -142,6 +177,80 @@ def analyze_quiz_only(submission: QuizSubmission):
         raise HTTPException(status_code=500, detail=f"Error analyzing quiz: {str(e)}")
 
 
+@app.websocket("/ws/quiz-session")
+async def quiz_session(websocket: WebSocket):
+    """Incremental quiz session: answers are graded as they arrive and feedback is prefetched
+    before Submit. See `quiz_session.py` for the message protocol.
+    """
+    await websocket.accept()
+    session = None
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            try:
+                raw = frame.get("text") if frame.get("text") is not None else frame.get("bytes")
+                try:
+                    message = json.loads(raw)
+                except (TypeError, ValueError):
+                    await websocket.send_json({"type": "error", "detail": "Messages must be JSON objects"})
+                    continue
+                kind = message.get("type") if isinstance(message, dict) else None
+                if kind == "start" and session is not None:
+                    # one session per connection, so a restart cannot reset the speculation budget
+                    await websocket.send_json({"type": "error",
+                                               "detail": "A quiz session is already running; open a new connection"})
+                elif kind == "start":
+                    session = QuizSession(message.get("title"), run_feedback=_run_feedback)
+                    await websocket.send_json({"type": "ready", "title": session.title,
+                                               "total_questions": session.total_questions})
+                elif session is None:
+                    await websocket.send_json({"type": "error", "detail": "Send a 'start' message first"})
+                elif kind == "answer":
+                    answer = AnswerSubmission.model_validate(message)
+                    session.record_answer(answer.question_id, answer.user_answer)
+                    session.prefetch()
+                    await websocket.send_json({"type": "progress", "answered": len(session.answers),
+                                               "total_questions": session.total_questions})
+                elif kind == "submit":
+                    response, speculative = await session.submit()
+                    await websocket.send_json({"type": "feedback", "speculative": speculative,
+                                               "result": response.model_dump()})
+                else:
+                    await websocket.send_json({"type": "error", "detail": f"Unknown message type: {kind!r}"})
+            except (ValidationError, ValueError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+            except Exception:
+                await websocket.send_json({"type": "error", "detail": "Error processing quiz"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if session is not None:
+            session.close()
+
+
+def require_profiling_admin(request: Request):
+    if not PROFILING_ADMIN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if request.client is None or request.client.host not in LOOPBACK_HOSTS:
+        raise HTTPException(status_code=403, detail="Profiling settings are only available from localhost")
+
+
+@app.get("/debug/profiling", dependencies=[Depends(require_profiling_admin)])
+def get_profiling():
+    return get_profiling_config()
+
+
+@app.post("/debug/profiling", dependencies=[Depends(require_profiling_admin)])
+def update_profiling(settings: ProfilingSettings):
+    """Change profiler settings at runtime, e.g. {"enabled": true, "slow_ms": 1500}.
+
+    Out-of-range or mistyped values are rejected with 422; output_dir is set by PROFILE_DIR only.
+    """
+    return configure_profiling(**settings.model_dump(exclude_unset=True))
+
+
 # /feedback/simple removed — compact requests are accepted by POST /feedback
 
 
@@ -16,3 +16,12 @@ MOCK_QUIZ = Quiz(
 
 
 MOCK_QUIZ_2 = MOCK_QUIZ
+
+
+def mock_quiz_for_title(title: str = None) -> Quiz:
+    """Pick the base quiz for a compact attempt by title; unknown or missing titles use MOCK_QUIZ."""
+    if title == MOCK_QUIZ.title:
+        return MOCK_QUIZ
+    if title == MOCK_QUIZ_2.title:
+        return MOCK_QUIZ_2
+    return MOCK_QUIZ
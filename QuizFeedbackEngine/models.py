@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, Discriminator, Tag, StrictBool
+from typing import Annotated, List, Optional, Union
 
 
 class Answer(BaseModel):
@@ -23,6 +23,8 @@ class Quiz(BaseModel):
 
 class QuizSubmission(BaseModel):
     quiz: Quiz
+    # client-generated id of this attempt; repeats with the same id return the stored feedback
+    attempt_id: Optional[str] = None
 
 
 class FeedbackResponse(BaseModel):
@@ -30,6 +32,21 @@ class FeedbackResponse(BaseModel):
     total_questions: int
     feedback: str
     question_feedback: Optional[List[dict]] = None
+    # estimated (or provider-reported) prompt size of the LLM call; None when no LLM call was made
+    prompt_tokens: Optional[int] = None
+    # "llm", "template", "llm_unavailable" (LLM failed, results-only fallback) or "error"
+    feedback_source: Optional[str] = None
+
+
+class ProfilingSettings(BaseModel):
+    """Body of POST /debug/profiling. Omitted fields keep their current value."""
+    model_config = ConfigDict(extra="forbid")
+
+    enabled: StrictBool = None
+    sample_rate: float = Field(None, ge=0.0, le=1.0)
+    # null turns off the slow-request trigger
+    slow_ms: Optional[float] = Field(None, ge=0.0)
+    interval_ms: float = Field(None, gt=0.0, le=1000.0)
 
 
 class AnswerSubmission(BaseModel):
@@ -44,8 +61,27 @@ class QuizAttempt(BaseModel):
         Example:
         {
             "title": "Collisions and Momentum",   # optional, used to select the mock quiz
-            "answers": [ {"question_id": 1, "user_answer": 2}, ... ]
+            "answers": [ {"question_id": 1, "user_answer": 2}, ... ],
+            "attempt_id": "6f1c..."                # optional, deduplicates retried submissions
         }
         """
         title: Optional[str] = None
         answers: List[AnswerSubmission]
+        attempt_id: Optional[str] = None
+
+
+def _feedback_request_kind(value) -> str:
+    """Pick the union member: anything carrying a `quiz` is a full submission, otherwise a compact attempt."""
+    if isinstance(value, dict):
+        return "submission" if "quiz" in value else "attempt"
+    return "submission" if isinstance(value, QuizSubmission) else "attempt"
+
+
+# Body of POST /feedback: either shape, resolved by one dispatch + one validation pass.
+FeedbackRequest = Annotated[
+    Union[
+        Annotated[QuizSubmission, Tag("submission")],
+        Annotated[QuizAttempt, Tag("attempt")],
+    ],
+    Discriminator(_feedback_request_kind),
+]
@@ -0,0 +1,280 @@
+"""Opt-in sampling profiler for slow HTTP requests.
+
+Disabled by default. When enabled, a single background thread periodically samples the stacks of
+the threads working on the requests being profiled (via `sys._current_frames`) and counts collapsed
+stacks. `ProfiledRoute` covers the whole request: body parsing and validation and response
+serialization on the event-loop thread, plus the endpoint and response-model validation in worker
+threads. Samples of the event loop idling in `select` are dropped; other requests sharing the loop
+can still show up in its stacks.
+
+A profile is written for a random fraction of requests (`sample_rate`) and for every request slower
+than `slow_ms`. Each profile file holds one JSON metadata line followed by collapsed stacks
+("module:function:line;... count"), which flamegraph tools read directly.
+
+Configuration comes from the environment at startup. Everything except the output directory can be
+changed at runtime via `configure()` (exposed as `GET/POST /debug/profiling` when PROFILE_ADMIN is set):
+
+- PROFILE_ENABLED       "1" to enable (default off)
+- PROFILE_SAMPLE_RATE   fraction of requests always written, 0.0-1.0 (default 0.0)
+- PROFILE_SLOW_MS       write any request at least this slow in ms; empty disables (default empty)
+- PROFILE_INTERVAL_MS   stack sampling interval in ms (default 5)
+- PROFILE_DIR           output directory (default ./profiles); startup only
+"""
+from collections import Counter
+from contextlib import contextmanager
+import contextvars
+import functools
+import inspect
+import json
+import os
+import pathlib
+import random
+import sys
+import threading
+import time
+
+from fastapi.routing import APIRoute
+
+
+def _env_float(name: str, default):
+    value = os.getenv(name, "")
+    try:
+        return float(value) if value.strip() else default
+    except ValueError:
+        return default
+
+
+_config = {
+    "enabled": os.getenv("PROFILE_ENABLED", "0").lower() in ("1", "true", "yes"),
+    "sample_rate": _env_float("PROFILE_SAMPLE_RATE", 0.0),
+    "slow_ms": _env_float("PROFILE_SLOW_MS", None),
+    "interval_ms": _env_float("PROFILE_INTERVAL_MS", 5.0),
+    "output_dir": os.getenv("PROFILE_DIR", str(pathlib.Path(__file__).resolve().parent / "profiles")),
+}
+_config_lock = threading.Lock()
+
+# settings `configure()` may change; output_dir is fixed at startup so callers cannot pick where files go
+RUNTIME_SETTINGS = ("enabled", "sample_rate", "slow_ms", "interval_ms")
+
+
+def get_config() -> dict:
+    return dict(_config)
+
+
+def configure(**changes) -> dict:
+    """Update profiler settings at runtime; keys outside RUNTIME_SETTINGS raise ValueError.
+
+    Values are not checked here; `models.ProfilingSettings` validates them for the HTTP endpoint.
+    Returns the new config.
+    """
+    unknown = set(changes) - set(RUNTIME_SETTINGS)
+    if unknown:
+        raise ValueError(f"Settings cannot be changed at runtime: {', '.join(sorted(unknown))}")
+    with _config_lock:
+        _config.update(changes)
+    return get_config()
+
+
+class _StackSampler:
+    """Background thread sampling the stacks of registered threads while any are registered."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # thread ident -> Counters of collapsed stacks, one per profile sampling that thread
+        # (the event-loop thread can serve several profiled requests at once)
+        self._targets = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def register(self, ident: int, stacks: Counter):
+        with self._lock:
+            self._targets.setdefault(ident, []).append(stacks)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def unregister(self, ident: int, stacks: Counter):
+        with self._lock:
+            counters = self._targets.get(ident, [])
+            for i, counter in enumerate(counters):
+                if counter is stacks:
+                    del counters[i]
+                    break
+            if not counters:
+                self._targets.pop(ident, None)
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while True:
+            with self._lock:
+                idle = not self._targets
+            if idle:
+                self._wakeup.clear()
+                self._wakeup.wait()
+                continue
+
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, counters in self._targets.items():
+                    frame = frames.get(ident)
+                    if frame is None or ident == own_ident or _is_idle(frame):
+                        continue
+                    stack = _collapse(frame)
+                    for stacks in counters:
+                        stacks[stack] += 1
+            del frames
+            time.sleep(max(_config["interval_ms"], 0.5) / 1000.0)
+
+
+def _is_idle(frame) -> bool:
+    # an event loop waiting for I/O
+    return frame.f_globals.get("__name__") == "selectors"
+
+
+def _collapse(frame) -> str:
+    # label frames by module name so library code (e.g. langgraph.pregel.main) is not
+    # mistaken for the service's own modules of the same file name
+    parts = []
+    while frame is not None:
+        module = frame.f_globals.get("__name__") or pathlib.Path(frame.f_code.co_filename).stem
+        parts.append(f"{module}:{frame.f_code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+_sampler = _StackSampler()
+
+
+def _write_profile(stacks: Counter, metadata: dict):
+    out_dir = pathlib.Path(_config["output_dir"])
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(metadata["started_at"]))
+    name = f"{stamp}-{metadata['endpoint'].strip('/').replace('/', '_') or 'root'}-{int(metadata['duration_ms'])}ms-{random.randrange(16**6):06x}.txt"
+    with open(out_dir / name, "w", encoding="utf-8") as fh:
+        fh.write(json.dumps(metadata) + "\n")
+        for stack, count in stacks.most_common():
+            fh.write(f"{stack} {count}\n")
+
+
+class _Profile:
+    __slots__ = ("meta", "stacks", "threads", "active")
+
+    def __init__(self, meta: dict):
+        self.meta = meta
+        self.stacks = Counter()
+        self.threads = set()  # idents of every thread sampled for this request
+        self.active = set()   # idents being sampled right now
+
+
+# the profile of the request running in this context; worker threads inherit it from the event loop
+_active_profile = contextvars.ContextVar("active_profile", default=None)
+
+
+@contextmanager
+def _sample_current_thread(profile: _Profile):
+    ident = threading.get_ident()
+    if ident in profile.active:
+        yield
+        return
+    profile.threads.add(ident)
+    profile.active.add(ident)
+    _sampler.register(ident, profile.stacks)
+    try:
+        yield
+    finally:
+        _sampler.unregister(ident, profile.stacks)
+        profile.active.discard(ident)
+
+
+@contextmanager
+def profile_thread():
+    """Also sample the current thread while it works for the request being profiled, if any."""
+    profile = _active_profile.get()
+    if profile is None:
+        yield
+        return
+    with _sample_current_thread(profile):
+        yield
+
+
+def current_profile():
+    """Metadata dict of the request being profiled in this context (None when not profiled)."""
+    profile = _active_profile.get()
+    return profile.meta if profile is not None else None
+
+
+@contextmanager
+def profile_request(endpoint: str, **metadata):
+    """Profile the enclosed block on the current thread if profiling is enabled.
+
+    Worker threads join the profile through `profile_thread()`. Callers may add request metadata
+    to the yielded dict (it is None when profiling is off). Writing the profile never raises into
+    the request.
+    """
+    if not _config["enabled"]:
+        yield None
+        return
+
+    sampled = random.random() < (_config["sample_rate"] or 0.0)
+    slow_ms = _config["slow_ms"]
+    if not sampled and slow_ms is None:
+        yield None
+        return
+
+    profile = _Profile(dict(metadata, endpoint=endpoint, started_at=time.time()))
+    token = _active_profile.set(profile)
+    start = time.perf_counter()
+    try:
+        with _sample_current_thread(profile):
+            yield profile.meta
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000.0
+        _active_profile.reset(token)
+        slow = slow_ms is not None and duration_ms >= slow_ms
+        if sampled or slow:
+            profile.meta.update(
+                duration_ms=round(duration_ms, 2),
+                reason="sampled" if sampled else "slow",
+                interval_ms=_config["interval_ms"],
+                samples=sum(profile.stacks.values()),
+                threads=len(profile.threads),
+            )
+            try:
+                _write_profile(profile.stacks, profile.meta)
+            except Exception as e:
+                print(f"profiling: could not write profile: {e}")
+
+
+def _in_profiled_thread(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with profile_thread():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute that profiles the whole request, not just the endpoint body.
+
+    Parsing and validating the body and serializing the response happen on the event-loop thread
+    around the endpoint; a sync endpoint and its response-model validation run in worker threads,
+    which join the profile through `profile_thread()`.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = _in_profiled_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+        if self.response_field is not None:
+            # FastAPI validates the return value of a sync endpoint in another worker thread
+            self.response_field.validate = _in_profiled_thread(self.response_field.validate)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request):
+            with profile_request(self.path, method=request.method):
+                return await handler(request)
+
+        return profiled_handler
@@ -0,0 +1,184 @@
+from functools import lru_cache
+import json
+import os
+import pathlib
+
+
+# Rough upper bound for the user prompt + system prompt sent to the LLM.
+# Missed questions and quizzes beyond this budget are summarised as a count instead of listed.
+# The fixed system prompt, instruction prefix and the first quiz's score line (~160 tokens) are
+# always sent; a budget below that is raised to it, with a warning.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "300"))
+
+_warned_budgets = set()
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text).
+
+    Used for budgeting and reporting when the provider does not return usage metadata.
+    """
+    if not text:
+        return 0
+    return max(1, (len(text) + 3) // 4)
+
+
+def normalize_title(s: str) -> str:
+    return ''.join(ch for ch in (s or "").lower() if ch.isalnum())
+
+
+@lru_cache(maxsize=1)
+def load_topics_by_quiz() -> dict:
+    """Load `topics_by_quiz.json` once per process; empty dict if missing or unreadable."""
+    topics_file = pathlib.Path(__file__).resolve().parent / "topics_by_quiz.json"
+    try:
+        with open(topics_file, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _is_nested(topics_by_quiz: dict) -> bool:
+    return any(isinstance(v, dict) for v in topics_by_quiz.values())
+
+
+@lru_cache(maxsize=64)
+def canonical_title(title: str):
+    """Return the `topics_by_quiz.json` key matching `title` (exact, then substring match), or None.
+
+    Prompts only ever use this canonical key, never the client-supplied title.
+    """
+    topics_by_quiz = load_topics_by_quiz()
+    title_norm = normalize_title(title)
+    if not title_norm or not _is_nested(topics_by_quiz):
+        return None
+    # 1) exact normalized match
+    for k, v in topics_by_quiz.items():
+        if isinstance(v, dict) and normalize_title(k) == title_norm:
+            return k
+    # 2) substring match (either direction)
+    for k, v in topics_by_quiz.items():
+        if not isinstance(v, dict):
+            continue
+        k_norm = normalize_title(k)
+        if k_norm in title_norm or title_norm in k_norm:
+            return k
+    return None
+
+
+@lru_cache(maxsize=64)
+def topics_for_title(title: str) -> dict:
+    """Return {question_id: topic} for the quiz matching `title`.
+
+    The returned dict is shared between calls and must not be mutated.
+    """
+    topics_by_quiz = load_topics_by_quiz()
+    if not _is_nested(topics_by_quiz):
+        # flat mapping
+        try:
+            return {int(k): str(v) for k, v in topics_by_quiz.items()}
+        except Exception:
+            return {}
+
+    key = canonical_title(title)
+    if key is None:
+        return {}
+    return {int(k2): str(v2) for k2, v2 in topics_by_quiz[key].items()}
+
+
+@lru_cache(maxsize=64)
+def system_prompt(title: str = None) -> str:
+    """Static system prompt, cached per canonical quiz title so the prefix is byte-identical across requests."""
+    prompt = """You are a concise educational tutor. Provide feedback in 2-3 short sentences.
+If all answers are correct, reply with a single short celebratory sentence.
+If there are incorrect answers, briefly state the score, name up to two of the listed topics to review, and finish with a short encouraging sentence.
+Always use a positive, supportive tone. Responses MUST be in ENGLISH.
+"""
+    if title:
+        prompt += f'The student has just taken the "{title}" quiz.\n'
+    return prompt
+
+
+@lru_cache(maxsize=64)
+def prompt_prefix(title: str = None) -> str:
+    """Static head of the user prompt (instructions), cached per canonical quiz title."""
+    quiz_name = f' for "{title}"' if title else ""
+    return f"""Give concise feedback{quiz_name} (2-3 short sentences).
+Only the missed questions are listed, each with its review topic.
+
+Results:
+"""
+
+
+def build_feedback_prompt(state: dict, token_budget: int = None):
+    """Build a compact (system_prompt, user_prompt, prompt_tokens) triple from an analysed state.
+
+    Only missed questions are included, each paired with the topic from the matching quiz in
+    `topics_by_quiz.json`. Once the token budget is reached the remaining missed questions and
+    quizzes are collapsed into a single "+N more" line, so the prompt stays within the budget.
+    """
+    if token_budget is None:
+        token_budget = PROMPT_TOKEN_BUDGET
+
+    summaries = state.get("per_quiz_summary") or []
+    if not summaries:
+        quiz = state.get("quiz")
+        summaries = [{
+            "title": getattr(quiz, "title", None),
+            "score": state.get("score", 0),
+            "total_questions": state.get("total_questions", 0),
+            "question_details": state.get("question_details", []),
+        }]
+
+    # Client titles are untrusted: only canonical keys from topics_by_quiz.json reach the prompt.
+    titles = [canonical_title(summary.get("title")) for summary in summaries]
+    single_title = titles[0] if len(summaries) == 1 else None
+    system = system_prompt(single_title)
+    prefix = prompt_prefix(single_title)
+    used = estimate_tokens(system) + estimate_tokens(prefix)
+    # room kept for the trailing "+N more" line, so the budget holds even when we truncate
+    reserve = estimate_tokens("- +999 more missed, +999 more quizzes") + 1
+
+    headers = [
+        f"Score: {summary['score']}/{summary['total_questions']}" if len(summaries) == 1
+        else f"{titles[qpos] or f'Quiz {qpos + 1}'}: {summary['score']}/{summary['total_questions']}"
+        for qpos, summary in enumerate(summaries)
+    ]
+    # the system prompt asks the model to state the score, so the first score line is never dropped
+    floor = used + estimate_tokens(headers[0]) + 1 + reserve
+    if token_budget < floor:
+        if token_budget not in _warned_budgets:
+            _warned_budgets.add(token_budget)
+            print(f"prompt_builder: token budget {token_budget} is below the fixed prompt size; using {floor}")
+        token_budget = floor
+
+    lines = []
+    truncated = False
+    for qpos, summary in enumerate(summaries):
+        header = headers[qpos]
+        cost = estimate_tokens(header) + 1
+        if used + cost + reserve > token_budget:
+            lines.append(f"- +{len(summaries) - qpos} more quizzes")
+            break
+        lines.append(header)
+        used += cost
+
+        topics = topics_for_title(summary.get("title"))
+        missed = [d for d in summary.get("question_details", []) if not d.get("is_correct")]
+        for pos, detail in enumerate(missed):
+            topic = topics.get(detail.get("question_id"))
+            line = f"- Q{detail.get('question_id')}: {topic}" if topic else f"- Q{detail.get('question_id')}"
+            cost = estimate_tokens(line) + 1
+            if used + cost + reserve > token_budget:
+                rest = len(summaries) - qpos - 1
+                lines.append(f"- +{len(missed) - pos} more missed" + (f", +{rest} more quizzes" if rest else ""))
+                truncated = True
+                break
+            lines.append(line)
+            used += cost
+        if truncated:
+            break
+
+    user = prefix + "\n".join(lines) + "\n"
+    return system, user, estimate_tokens(system) + estimate_tokens(user)
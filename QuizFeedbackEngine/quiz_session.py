@@ -0,0 +1,141 @@
+"""Incremental quiz sessions for the `/ws/quiz-session` WebSocket endpoint.
+
+The client sends each answer as it is chosen. The session grades it against the answer key
+right away and keeps a running score. Feedback text depends only on the quiz and on which
+questions are correct (the "correctness pattern"), not on the exact wrong option picked. So once
+all but one question are answered, the session generates feedback in the background for both
+possible outcomes of the last question. When Submit arrives, the matching result is usually
+already done. Only LLM and template feedback is reused, because the "AI unavailable" fallback
+quotes the raw answers. A connection runs one session, which makes at most MAX_SPECULATIVE_RUNS
+speculative runs; a second "start" on the same socket is refused. When the socket closes the
+session is closed: no new guesses start and pending ones are cancelled.
+
+Protocol (JSON messages):
+    -> {"type": "start", "title": "Pendulum Basics"}
+    <- {"type": "ready", "title": ..., "total_questions": 5}
+    -> {"type": "answer", "question_id": 1, "user_answer": 2}
+    <- {"type": "progress", "answered": 1, "total_questions": 5}
+    -> {"type": "submit"}
+    <- {"type": "feedback", "speculative": true, "result": {...FeedbackResponse...}}
+    <- {"type": "error", "detail": "..."}   (on any invalid message or a repeated "start")
+"""
+import asyncio
+
+from langgraph_workflow import analyze_single_quiz, load_answer_key, select_answer_map
+from mock_data import mock_quiz_for_title
+from models import FeedbackResponse, Question, Quiz
+
+
+# Total speculative feedback runs allowed per session (and so per connection). Students may change
+# answers after finishing; once the limit is reached, Submit computes feedback directly.
+MAX_SPECULATIVE_RUNS = 6
+
+# Feedback from these sources depends only on the correctness pattern, so it can be reused for
+# other answers with the same pattern. The "llm_unavailable" fallback embeds the raw answers.
+REUSABLE_SOURCES = ("llm", "template")
+
+
+def _log_failed_speculation(task: asyncio.Task) -> None:
+    # submit() recomputes when a guess failed; just record why
+    if not task.cancelled() and task.exception() is not None:
+        print(f"quiz session: speculative feedback failed: {task.exception()!r}")
+
+
+class QuizSession:
+    def __init__(self, title: str, run_feedback):
+        """`run_feedback(quiz) -> FeedbackResponse` is the blocking feedback pipeline."""
+        base = mock_quiz_for_title(title)
+        self.title = title or base.title
+        self.question_ids = [q.id for q in base.questions]
+        self.answer_map = select_answer_map(load_answer_key(), Quiz(title=self.title, questions=base.questions))
+        self.answers = {}   # question_id -> user_answer
+        self.correct = {}   # question_id -> bool, graded as answers arrive
+        self._run_feedback = run_feedback
+        self._speculations = {}  # correctness pattern -> asyncio.Task[FeedbackResponse]
+        self.speculative_runs = 0
+        self.closed = False
+
+    @property
+    def total_questions(self) -> int:
+        return len(self.question_ids)
+
+    @property
+    def score(self) -> int:
+        return sum(self.correct.values())
+
+    def record_answer(self, question_id: int, user_answer) -> None:
+        if question_id not in self.question_ids:
+            raise ValueError(f"Unknown question_id {question_id} for quiz '{self.title}'")
+        correct_index = self.answer_map.get(str(question_id))
+        self.answers[question_id] = user_answer
+        self.correct[question_id] = user_answer is not None and correct_index is not None and user_answer == correct_index
+
+    def _quiz(self, answers: dict) -> Quiz:
+        return Quiz.model_construct(
+            title=self.title,
+            questions=[Question.model_construct(id=qid, user_answer=answers.get(qid)) for qid in self.question_ids],
+        )
+
+    def _pattern(self, correct: dict) -> tuple:
+        return tuple(bool(correct.get(qid)) for qid in self.question_ids)
+
+    def _speculate(self, answers: dict, correct: dict) -> None:
+        pattern = self._pattern(correct)
+        if self.closed or pattern in self._speculations or self.speculative_runs >= MAX_SPECULATIVE_RUNS:
+            return
+        self.speculative_runs += 1
+        task = asyncio.create_task(asyncio.to_thread(self._run_feedback, self._quiz(answers)))
+        task.add_done_callback(_log_failed_speculation)
+        self._speculations[pattern] = task
+
+    def prefetch(self) -> None:
+        """Start feedback generation for the likely final correctness patterns.
+
+        With every question answered, that is the current pattern. With one question left, it is
+        both outcomes for that question. Earlier in the quiz nothing is prefetched.
+        """
+        remaining = [qid for qid in self.question_ids if qid not in self.answers]
+        if not remaining:
+            self._speculate(self.answers, self.correct)
+        elif len(remaining) == 1:
+            last = remaining[0]
+            correct_index = self.answer_map.get(str(last))
+            if correct_index is not None:
+                self._speculate({**self.answers, last: correct_index}, {**self.correct, last: True})
+            self._speculate({**self.answers, last: None}, {**self.correct, last: False})
+
+    async def submit(self):
+        """Return (FeedbackResponse, speculative) for the answers recorded so far."""
+        quiz = self._quiz(self.answers)
+        task = None if self.closed else self._speculations.get(self._pattern(self.correct))
+        speculated = None
+        if task is not None:
+            try:
+                speculated = await task
+            except Exception:
+                speculated = None
+        if speculated is None or speculated.feedback_source not in REUSABLE_SOURCES:
+            return await asyncio.to_thread(self._run_feedback, quiz), False
+
+        # Reuse the pattern-dependent parts; grade the actual answers for the per-question details.
+        details = analyze_single_quiz(quiz, self.answer_map)["question_details"]
+        for d in details:
+            d["quiz_index"] = 1
+        return FeedbackResponse(
+            overall_score=self.score,
+            total_questions=self.total_questions,
+            feedback=speculated.feedback,
+            question_feedback=details,
+            prompt_tokens=speculated.prompt_tokens,
+            feedback_source=speculated.feedback_source
+        ), True
+
+    def close(self) -> None:
+        """Stop speculating once the client is gone.
+
+        Pending guesses are cancelled so their results are dropped; an LLM call already running in
+        a worker thread cannot be interrupted and finishes on its own.
+        """
+        self.closed = True
+        for task in self._speculations.values():
+            task.cancel()
@@ -0,0 +1,157 @@
+"""Local OpenAI-compatible stand-in for OpenRouter, used by `loadtest.py`.
+
+Implements `POST /v1/chat/completions` (plain and `"stream": true` SSE) and `GET /v1/models`
+with configurable latency, error rate and streaming pace, so `/feedback` can be load-tested
+without network access or OpenRouter quota.
+
+Usage:
+    python stub_openrouter.py --port 8089 --latency lognormal:400:0.5 --error-rate 0.02
+
+Latency specs (milliseconds):
+    fixed:MS                constant delay
+    uniform:LOW:HIGH        uniform between LOW and HIGH
+    normal:MEAN:STD         normal, clipped at 0
+    lognormal:MEDIAN:SIGMA  lognormal with the given median and shape (long tail)
+
+For streamed responses the latency is the time to first token; each following chunk waits
+`token_ms`.
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+
+
+STUB_REPLY = (
+    "Good effort on this quiz. Review the listed topics, starting with the first one. "
+    "Keep practicing and you will see steady progress!"
+)
+
+_config = {
+    "latency": os.getenv("STUB_LATENCY", "fixed:300"),
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", "0")),
+    "error_status": int(os.getenv("STUB_ERROR_STATUS", "500")),
+    "token_ms": float(os.getenv("STUB_TOKEN_MS", "15")),
+    "reply": os.getenv("STUB_REPLY", STUB_REPLY),
+}
+
+
+def parse_latency(spec: str):
+    """Turn a latency spec into a zero-argument sampler returning milliseconds."""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(":") if v]
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(max(values[0], 1e-3))
+        return lambda: random.lognormvariate(mu, values[1])
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+_sample_latency_ms = parse_latency(_config["latency"])
+
+app = FastAPI(title="OpenRouter stub", description="OpenAI-compatible stub for load tests")
+
+
+def _prompt_tokens(messages: list) -> int:
+    return sum(max(1, len(str(m.get("content", ""))) // 4) for m in messages)
+
+
+def _error_response():
+    return JSONResponse(
+        status_code=_config["error_status"],
+        content={"error": {"message": "Injected stub error", "type": "server_error", "code": _config["error_status"]}},
+    )
+
+
+@app.get("/v1/models")
+def list_models():
+    return {"object": "list", "data": [{"id": "stub-model", "object": "model", "owned_by": "stub"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub-model")
+    messages = body.get("messages", [])
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    await asyncio.sleep(_sample_latency_ms() / 1000.0)
+    if random.random() < _config["error_rate"]:
+        return _error_response()
+
+    reply = _config["reply"]
+    usage = {
+        "prompt_tokens": _prompt_tokens(messages),
+        "completion_tokens": max(1, len(reply) // 4),
+    }
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    async def event_stream():
+        def chunk(delta: dict, finish_reason=None, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            payload.update(extra)
+            return f"data: {json.dumps(payload)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+        words = reply.split(" ")
+        for i, word in enumerate(words):
+            yield chunk({"content": word if i == 0 else " " + word})
+            await asyncio.sleep(_config["token_ms"] / 1000.0)
+        yield chunk({}, finish_reason="stop")
+        if include_usage:
+            yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default=_config["latency"], help="latency spec, e.g. lognormal:400:0.5")
+    parser.add_argument("--error-rate", type=float, default=_config["error_rate"], help="fraction of requests failing")
+    parser.add_argument("--error-status", type=int, default=_config["error_status"], help="HTTP status of injected errors")
+    parser.add_argument("--token-ms", type=float, default=_config["token_ms"], help="delay between streamed chunks")
+    args = parser.parse_args()
+
+    _sample_latency_ms = parse_latency(args.latency)
+    _config.update(latency=args.latency, error_rate=args.error_rate,
+                   error_status=args.error_status, token_ms=args.token_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,40 @@
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import langgraph_workflow
+
+
+class FakeLLM:
+    """Replaces ChatOpenAI in `generate_feedback`: records prompts, can fail or be slow."""
+
+    def __init__(self):
+        self.reply = "Good effort. Review the listed topics and try again!"
+        self.delay = 0.0
+        self.failures = 0   # number of upcoming calls that raise
+        self.calls = []     # list of [SystemMessage, HumanMessage]
+        self._lock = threading.Lock()
+
+    def __call__(self, **kwargs):
+        # ChatOpenAI(...) is constructed per call; hand back this instance as the client
+        return self
+
+    def invoke(self, messages):
+        with self._lock:
+            self.calls.append(messages)
+            fail = self.failures > 0
+            self.failures -= fail
+        time.sleep(self.delay)
+        if fail:
+            raise RuntimeError("LLM provider unavailable")
+        return AIMessage(content=self.reply)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    llm = FakeLLM()
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setattr(langgraph_workflow, "ChatOpenAI", llm)
+    return llm
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from langgraph_workflow import create_quiz_feedback_workflow, fan_out_quizzes, merge_quiz_results
+from models import Question, Quiz
+
+
+# answer keys: "Pendulum Basics" 1, 1, 0, 1, 0 / "Collisions and Momentum" 2, 2, 0, 1, 2
+PENDULUM_ONE_WRONG = ("Pendulum Basics", [1, 1, 0, 1, 3])
+PENDULUM_PERFECT = ("Pendulum Basics", [1, 1, 0, 1, 0])
+COLLISIONS_TWO_WRONG = ("Collisions and Momentum", [2, 2, 0, 3, 3])
+
+
+def quiz(title, answers):
+    return Quiz(title=title, questions=[Question(id=qid, user_answer=a) for qid, a in enumerate(answers, start=1)])
+
+
+def branch_result(quiz_index, **overrides):
+    result = {
+        "quiz_index": quiz_index, "title": f"Quiz {quiz_index}", "total_questions": 5, "score": quiz_index,
+        "analysis": f"analysis {quiz_index}", "question_details": [{"question_id": 1, "quiz_index": quiz_index}],
+        "feedback": f"feedback {quiz_index}", "guardrail_check": "APPROVED", "prompt_tokens": None,
+        "feedback_route": "generate", "feedback_source": "llm",
+    }
+    result.update(overrides)
+    return result
+
+
+def test_quizzes_fan_out_and_merge_in_order(fake_llm):
+    graph = create_quiz_feedback_workflow()
+
+    result = graph.invoke({"quizzes": [quiz(*PENDULUM_ONE_WRONG), quiz(*COLLISIONS_TWO_WRONG),
+                                       quiz(*PENDULUM_PERFECT)]})
+
+    assert (result["score"], result["total_questions"]) == (4 + 3 + 5, 15)
+    assert [s["title"] for s in result["per_quiz_summary"]] == [
+        "Pendulum Basics", "Collisions and Momentum", "Pendulum Basics"]
+    assert [s["score"] for s in result["per_quiz_summary"]] == [4, 3, 5]
+    assert [d["quiz_index"] for d in result["question_details"]] == [1] * 5 + [2] * 5 + [3] * 5
+    assert result["feedback"].startswith(f"Pendulum Basics: {fake_llm.reply}\n\nCollisions and Momentum: ")
+    assert len(fake_llm.calls) == 2  # the perfect quiz takes the template route
+    assert result["prompt_tokens"] == sum(s["prompt_tokens"] for s in result["per_quiz_summary"][:2])
+    assert result["feedback_source"] == "llm"
+
+
+def test_merge_orders_branch_results_by_quiz_index():
+    # branches finish in any order; the merge restores submission order
+    update = merge_quiz_results({"quiz_results": [branch_result(3), branch_result(1), branch_result(2)]})
+
+    assert [s["title"] for s in update["per_quiz_summary"]] == ["Quiz 1", "Quiz 2", "Quiz 3"]
+    assert [d["quiz_index"] for d in update["question_details"]] == [1, 2, 3]
+    assert update["feedback"] == "Quiz 1: feedback 1\n\nQuiz 2: feedback 2\n\nQuiz 3: feedback 3"
+    assert (update["score"], update["total_questions"]) == (6, 15)
+    assert "quiz_index" not in update["per_quiz_summary"][0]
+    assert "prompt_tokens" not in update
+
+
+@pytest.mark.parametrize("checks, expected", [
+    (["APPROVED", "APPROVED"], "APPROVED"),
+    (["APPROVED", "WARNING: a", "WARNING: b"], "WARNING: a"),
+    (["BLOCKED: a", "WARNING: b", "BLOCKED: c"], "BLOCKED: a; BLOCKED: c"),
+])
+def test_merge_combines_guardrail_checks(checks, expected):
+    results = [branch_result(i, guardrail_check=c) for i, c in enumerate(checks, start=1)]
+    assert merge_quiz_results({"quiz_results": results})["guardrail_check"] == expected
+
+
+def test_blocked_branch_blocks_the_combined_result(fake_llm):
+    fake_llm.reply = "Honestly, just give up."
+    result = create_quiz_feedback_workflow().invoke({"quizzes": [quiz(*PENDULUM_PERFECT), quiz(*PENDULUM_ONE_WRONG)]})
+
+    assert result["guardrail_check"].startswith("BLOCKED: Contains harmful language: 'give up'")
+    assert [s["guardrail_check"].split(":")[0] for s in result["per_quiz_summary"]] == ["APPROVED", "BLOCKED"]
+
+
+@pytest.mark.parametrize("sources, expected", [
+    (["template", "template"], "template"),
+    (["template", "llm"], "llm"),
+    (["llm", "llm_unavailable", "template"], "llm_unavailable"),
+    (["llm_unavailable", "error"], "error"),
+])
+def test_merge_reports_least_reusable_feedback_source(sources, expected):
+    results = [branch_result(i, feedback_source=s) for i, s in enumerate(sources, start=1)]
+    assert merge_quiz_results({"quiz_results": results})["feedback_source"] == expected
+
+
+def test_empty_quizzes_go_straight_to_merge():
+    assert fan_out_quizzes({"quizzes": []}) == "merge"
+
+    result = create_quiz_feedback_workflow().invoke({"quizzes": []})
+
+    assert (result["score"], result["total_questions"]) == (0, 0)
+    assert result["per_quiz_summary"] == []
+    assert result["feedback_source"] == "error"
+    assert result["feedback"].startswith("Error: Cannot generate feedback")
+
+
+def test_branches_call_the_llm_concurrently(fake_llm):
+    fake_llm.delay = 0.5
+    quizzes = [quiz(*PENDULUM_ONE_WRONG), quiz(*COLLISIONS_TWO_WRONG)] * 2
+    graph = create_quiz_feedback_workflow()
+
+    start = time.perf_counter()
+    result = graph.invoke({"quizzes": quizzes})
+    elapsed = time.perf_counter() - start
+
+    assert len(fake_llm.calls) == 4
+    assert result["feedback_source"] == "llm"
+    # run one after another, four 0.5s calls would take 2s
+    assert elapsed < 1.2
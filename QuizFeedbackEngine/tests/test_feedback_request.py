@@ -0,0 +1,62 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from models import FeedbackResponse
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+
+    def fake_run_feedback(quiz):
+        calls.append(quiz)
+        return FeedbackResponse(overall_score=0, total_questions=len(quiz.questions), feedback="ok",
+                                feedback_source="template")
+
+    monkeypatch.setattr(main, "_run_feedback", fake_run_feedback)
+    return TestClient(main.app), calls
+
+
+@pytest.mark.parametrize("body, loc, error_type", [
+    ({"quiz": {"title": "Pendulum Basics", "questions": [{"id": "one"}]}},
+     ["body", "submission", "quiz", "questions", 0, "id"], "int_parsing"),
+    ({"quiz": "Pendulum Basics"}, ["body", "submission", "quiz"], "model_attributes_type"),
+    ([{"question_id": 1, "user_answer": 2}], ["body", "attempt"], "model_attributes_type"),
+    ("Pendulum Basics", ["body", "attempt"], "model_attributes_type"),
+    ({"title": "Pendulum Basics"}, ["body", "attempt", "answers"], "missing"),
+    ({"title": "Pendulum Basics", "answers": [{"user_answer": 1}]},
+     ["body", "attempt", "answers", 0, "question_id"], "missing"),
+])
+def test_malformed_bodies_are_rejected_with_422(client, body, loc, error_type):
+    http, calls = client
+
+    response = http.post("/feedback", json=body)
+
+    assert response.status_code == 422
+    [error] = response.json()["detail"]
+    # the second loc entry is the discriminator tag of the shape that was validated
+    assert error["loc"] == loc
+    assert error["type"] == error_type
+    assert calls == []
+
+
+@pytest.mark.parametrize("body", [
+    {"quiz": {"title": "Pendulum Basics", "questions": [{"id": 1, "user_answer": 1}]}},
+    {"title": "Pendulum Basics", "answers": [{"question_id": 1, "user_answer": 1}]},
+])
+def test_both_shapes_are_accepted(client, body):
+    http, calls = client
+    assert http.post("/feedback", json=body).status_code == 200
+    assert calls[0].title == "Pendulum Basics"
+
+
+def test_openapi_documents_both_request_shapes():
+    schema = TestClient(main.app).get("/openapi.json").json()
+    body_schema = schema["paths"]["/feedback"]["post"]["requestBody"]["content"]["application/json"]["schema"]
+
+    assert body_schema["oneOf"] == [
+        {"$ref": "#/components/schemas/QuizSubmission"},
+        {"$ref": "#/components/schemas/QuizAttempt"},
+    ]
+    assert "answers" in schema["components"]["schemas"]["QuizAttempt"]["required"]
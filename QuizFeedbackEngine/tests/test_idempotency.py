@@ -0,0 +1,146 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from idempotency import IdempotencyKeyConflict, IdempotencyStore
+from models import FeedbackResponse
+
+
+class Counter:
+    """compute() stand-in that counts calls and returns the call number."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+
+def test_duplicate_in_flight_waits_for_original():
+    store = IdempotencyStore()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(store.run("k", "fp", slow_compute)))
+    first.start()
+    assert started.wait(5)
+    second = threading.Thread(target=lambda: results.append(store.run("k", "fp", slow_compute)))
+    second.start()
+    second.join(0.2)
+    assert second.is_alive()  # blocked on the running original
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert results == ["result", "result"]
+    assert len(calls) == 1
+
+
+def test_same_key_different_payload_conflicts():
+    store = IdempotencyStore()
+    store.run("k", "fp-1", Counter())
+    with pytest.raises(IdempotencyKeyConflict):
+        store.run("k", "fp-2", Counter())
+
+
+def test_failure_does_not_evict_stored_results():
+    store = IdempotencyStore(max_entries=1)
+    compute = Counter()
+    assert store.run("a", "fp", compute) == 1
+
+    def failing():
+        raise RuntimeError("LLM down")
+
+    with pytest.raises(RuntimeError):
+        store.run("b", "fp", failing)
+    assert store.run("a", "fp", compute) == 1
+    assert compute.calls == 1
+
+
+def test_limit_evicts_oldest_completed_entry():
+    store = IdempotencyStore(max_entries=1)
+    first, second = Counter(), Counter()
+    store.run("a", "fp", first)
+    store.run("b", "fp", second)
+    assert len(store) == 1
+    store.run("b", "fp", second)
+    assert second.calls == 1
+    store.run("a", "fp", first)
+    assert first.calls == 2
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+
+    def fake_run_feedback(quiz):
+        calls.append(quiz)
+        return FeedbackResponse(overall_score=len(calls), total_questions=len(quiz.questions), feedback="ok",
+                                feedback_source="llm")
+
+    monkeypatch.setattr(main, "_run_feedback", fake_run_feedback)
+    monkeypatch.setattr(main, "feedback_results", IdempotencyStore())
+    return TestClient(main.app), calls
+
+
+def attempt(user_answer):
+    return {"title": "Pendulum Basics", "answers": [{"question_id": 1, "user_answer": user_answer}]}
+
+
+def test_feedback_replays_stored_response(client):
+    http, calls = client
+    first = http.post("/feedback", json=attempt(1), headers={"Idempotency-Key": "k1"})
+    again = http.post("/feedback", json=attempt(1), headers={"Idempotency-Key": "k1"})
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+    assert len(calls) == 1
+
+
+def test_feedback_key_reused_with_other_answers_is_422(client):
+    http, calls = client
+    assert http.post("/feedback", json={**attempt(1), "attempt_id": "a1"}).status_code == 200
+    conflict = http.post("/feedback", json={**attempt(2), "attempt_id": "a1"})
+    assert conflict.status_code == 422
+    assert "different payload" in conflict.json()["detail"]
+    assert len(calls) == 1
+
+
+def test_result_rejected_by_keep_is_not_stored():
+    store = IdempotencyStore()
+    compute = Counter()
+    assert store.run("k", "fp", compute, keep=lambda result: result > 1) == 1
+    assert len(store) == 0
+    assert store.run("k", "fp", compute, keep=lambda result: result > 1) == 2
+    assert store.run("k", "fp", compute, keep=lambda result: result > 1) == 2
+
+
+def test_llm_outage_fallback_is_not_replayed(fake_llm, monkeypatch):
+    monkeypatch.setattr(main, "feedback_results", IdempotencyStore())
+    fake_llm.failures = 1
+    http = TestClient(main.app)
+    # one wrong answer: routed to the LLM, not the template
+    body = {"title": "Pendulum Basics", "attempt_id": "retry-1",
+            "answers": [{"question_id": q, "user_answer": a} for q, a in enumerate([1, 1, 0, 1, 3], start=1)]}
+
+    first = http.post("/feedback", json=body)
+    assert first.status_code == 200
+    assert first.json()["feedback_source"] == "llm_unavailable"
+
+    retry = http.post("/feedback", json=body)
+    assert retry.json()["feedback_source"] == "llm"
+    assert retry.json()["feedback"] == fake_llm.reply
+    assert len(fake_llm.calls) == 2
+
+    again = http.post("/feedback", json=body)
+    assert again.json() == retry.json()
+    assert len(fake_llm.calls) == 2
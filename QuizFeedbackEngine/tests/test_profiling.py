@@ -0,0 +1,90 @@
+import json
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import profiling
+
+
+@pytest.fixture
+def profiler(monkeypatch, tmp_path):
+    """Profiling config isolated per test, writing into tmp_path."""
+    monkeypatch.setattr(profiling, "_config", dict(profiling._config, enabled=False, sample_rate=0.0,
+                                                   slow_ms=None, interval_ms=1.0, output_dir=str(tmp_path)))
+    return tmp_path
+
+
+@pytest.fixture
+def admin(monkeypatch, profiler):
+    monkeypatch.setattr(main, "PROFILING_ADMIN", True)
+    return TestClient(main.app, client=("127.0.0.1", 50000))
+
+
+def test_profiling_routes_are_hidden_without_admin_flag(monkeypatch, profiler):
+    monkeypatch.setattr(main, "PROFILING_ADMIN", False)
+    local = TestClient(main.app, client=("127.0.0.1", 50000))
+    assert local.get("/debug/profiling").status_code == 404
+    assert local.post("/debug/profiling", json={"enabled": True}).status_code == 404
+
+
+def test_profiling_routes_only_answer_localhost(admin):
+    remote = TestClient(main.app, client=("203.0.113.7", 50000))
+    assert remote.get("/debug/profiling").status_code == 403
+    assert remote.post("/debug/profiling", json={"enabled": True}).status_code == 403
+    assert not profiling.get_config()["enabled"]
+    assert admin.get("/debug/profiling").status_code == 200
+
+
+@pytest.mark.parametrize("body", [
+    {"enabled": True, "sample_rate": "abc"},
+    {"sample_rate": 1.5},
+    {"sample_rate": -0.1},
+    {"slow_ms": -1},
+    {"interval_ms": 0},
+    {"enabled": None},
+    {"enabled": "yes"},
+    {"output_dir": "/tmp/elsewhere"},
+])
+def test_invalid_profiling_settings_are_rejected(admin, body):
+    before = profiling.get_config()
+    assert admin.post("/debug/profiling", json=body).status_code == 422
+    assert profiling.get_config() == before
+
+
+def test_valid_profiling_settings_are_applied(admin):
+    response = admin.post("/debug/profiling", json={"enabled": True, "sample_rate": 0.25, "slow_ms": None})
+    assert response.status_code == 200
+    assert response.json()["sample_rate"] == 0.25
+    assert profiling.get_config()["enabled"]
+
+
+def test_output_dir_cannot_be_changed_at_runtime(profiler):
+    with pytest.raises(ValueError, match="output_dir"):
+        profiling.configure(output_dir="/tmp/elsewhere")
+
+
+def test_sampled_request_writes_a_profile(profiler, fake_llm):
+    fake_llm.delay = 0.05
+    profiling.configure(enabled=True, sample_rate=1.0)
+    body = {"title": "Pendulum Basics",
+            "answers": [{"question_id": q, "user_answer": a} for q, a in enumerate([1, 1, 0, 1, 3], start=1)]}
+
+    assert TestClient(main.app).post("/feedback", json=body).status_code == 200
+
+    [path] = profiler.iterdir()
+    meta_line, *stack_lines = path.read_text(encoding="utf-8").splitlines()
+    meta = json.loads(meta_line)
+    assert meta["endpoint"] == "/feedback" and meta["method"] == "POST"
+    assert meta["title"] == "Pendulum Basics" and meta["reason"] == "sampled"
+    # the event-loop thread (body parsing) and the worker thread running the endpoint
+    assert meta["threads"] >= 2
+    assert meta["samples"] > 0
+    assert any("main:get_quiz_feedback" in line for line in stack_lines)
+
+
+def test_frames_are_labelled_by_module():
+    stack = profiling._collapse(sys._getframe())
+    assert stack.endswith(f"{__name__}:test_frames_are_labelled_by_module:{sys._getframe().f_lineno - 1}")
+    assert "_pytest.python:pytest_pyfunc_call" in stack
@@ -0,0 +1,142 @@
+import asyncio
+
+import quiz_session
+from models import FeedbackResponse
+from quiz_session import QuizSession
+
+
+# "Pendulum Basics" answer key: 1, 1, 0, 1, 0
+
+
+class FakePipeline:
+    """Stands in for the feedback pipeline; echoes each quiz's answers into the feedback text."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.calls = []
+
+    def __call__(self, quiz):
+        answers = [q.user_answer for q in quiz.questions]
+        self.calls.append(answers)
+        return FeedbackResponse(
+            overall_score=0,
+            total_questions=len(answers),
+            feedback=f"answers={answers}",
+            feedback_source=self.source,
+        )
+
+
+def answer_all(session, answers):
+    for qid, user_answer in enumerate(answers, start=1):
+        session.record_answer(qid, user_answer)
+        session.prefetch()
+
+
+def test_reused_feedback_reports_actual_answers():
+    async def scenario():
+        pipeline = FakePipeline("llm")
+        session = QuizSession("Pendulum Basics", run_feedback=pipeline)
+        answer_all(session, [1, 1, 0, 1, 3])
+        return pipeline, await session.submit()
+
+    pipeline, (response, speculative) = asyncio.run(scenario())
+
+    assert speculative
+    # the wrong-answer guess for Q5 ran with a placeholder, not the student's answer
+    assert [1, 1, 0, 1, None] in pipeline.calls
+    assert response.overall_score == 4
+    q5 = response.question_feedback[4]
+    assert q5["question_id"] == 5 and q5["user_answer"] == 3 and not q5["is_correct"]
+
+
+def test_fallback_feedback_is_regenerated_from_actual_answers():
+    async def scenario():
+        pipeline = FakePipeline("llm_unavailable")
+        session = QuizSession("Pendulum Basics", run_feedback=pipeline)
+        answer_all(session, [1, 1, 0, 1, 3])
+        return pipeline, await session.submit()
+
+    pipeline, (response, speculative) = asyncio.run(scenario())
+
+    assert not speculative
+    assert response.feedback == "answers=[1, 1, 0, 1, 3]"
+    assert pipeline.calls[-1] == [1, 1, 0, 1, 3]
+
+
+def test_speculative_runs_are_capped_per_session():
+    async def scenario():
+        pipeline = FakePipeline("llm")
+        session = QuizSession("Pendulum Basics", run_feedback=pipeline)
+        answer_all(session, [1, 1, 0, 1, 0])
+        # keep flipping answers after finishing: every combination is a new correctness pattern
+        for _ in range(5):
+            for qid in (1, 2, 3, 4):
+                session.record_answer(qid, 3)
+                session.prefetch()
+            for qid, user_answer in ((1, 1), (2, 1), (3, 0), (4, 1)):
+                session.record_answer(qid, user_answer)
+                session.prefetch()
+        await asyncio.gather(*session._speculations.values())
+        return pipeline, session
+
+    pipeline, session = asyncio.run(scenario())
+
+    assert session.speculative_runs == quiz_session.MAX_SPECULATIVE_RUNS
+    assert len(pipeline.calls) == quiz_session.MAX_SPECULATIVE_RUNS
+
+
+def test_invalid_frames_get_an_error_reply_and_keep_the_socket_open():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app).websocket_connect("/ws/quiz-session") as ws:
+        ws.send_text("not json")
+        assert ws.receive_json()["type"] == "error"
+        ws.send_bytes(b"\xff")
+        assert ws.receive_json()["type"] == "error"
+        ws.send_json({"type": "start", "title": "Pendulum Basics"})
+        assert ws.receive_json() == {"type": "ready", "title": "Pendulum Basics", "total_questions": 5}
+
+
+def test_closed_session_stops_speculating():
+    async def scenario():
+        pipeline = FakePipeline("llm")
+        session = QuizSession("Pendulum Basics", run_feedback=pipeline)
+        answer_all(session, [1, 1, 0, 1])
+        pending = list(session._speculations.values())
+        session.close()
+        await asyncio.gather(*pending, return_exceptions=True)
+        session.record_answer(5, 3)
+        session.prefetch()
+        return pipeline, session, pending, await session.submit()
+
+    pipeline, session, pending, (response, speculative) = asyncio.run(scenario())
+
+    assert len(pending) == 2 and all(task.cancelled() for task in pending)
+    assert session.speculative_runs == 2
+    assert not speculative
+    assert response.feedback == "answers=[1, 1, 0, 1, 3]"
+
+
+def test_second_start_on_the_same_socket_is_refused(monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    pipeline = FakePipeline("llm")
+    monkeypatch.setattr(main, "_run_feedback", pipeline)
+    with TestClient(main.app).websocket_connect("/ws/quiz-session") as ws:
+        ws.send_json({"type": "start", "title": "Pendulum Basics"})
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_json({"type": "answer", "question_id": 1, "user_answer": 1})
+        assert ws.receive_json()["answered"] == 1
+
+        ws.send_json({"type": "start", "title": "Collisions and Momentum"})
+        refused = ws.receive_json()
+        assert refused["type"] == "error" and "already running" in refused["detail"]
+
+        # the original session, and its speculation budget, carry on
+        ws.send_json({"type": "answer", "question_id": 2, "user_answer": 1})
+        assert ws.receive_json() == {"type": "progress", "answered": 2, "total_questions": 5}
+        ws.send_json({"type": "submit"})
+        result = ws.receive_json()["result"]
+        assert result["feedback"] == "answers=[1, 1, None, None, None]"
@@ -0,0 +1,67 @@
+import pytest
+
+import langgraph_workflow
+from langgraph_workflow import route_feedback, routing_stats
+from models import Quiz, Question
+
+
+# "Pendulum Basics" answer key: 1, 1, 0, 1, 0
+CORRECT = [1, 1, 0, 1, 0]
+WRONG = [2, 2, 2, 2, 2]
+
+
+def analysed_state(answers):
+    quiz = Quiz(title="Pendulum Basics",
+                questions=[Question(id=qid, user_answer=a) for qid, a in enumerate(answers, start=1)])
+    return langgraph_workflow.analyze_quiz({"quiz": quiz})
+
+
+@pytest.fixture
+def no_llm_no_guardrails(monkeypatch):
+    """Build a workflow whose LLM and guardrail nodes fail the test if they run."""
+    def must_not_run(state):
+        raise AssertionError("template route must skip the LLM and guardrails")
+
+    monkeypatch.setattr(langgraph_workflow, "generate_feedback", must_not_run)
+    monkeypatch.setattr(langgraph_workflow, "apply_guardrails", must_not_run)
+    return langgraph_workflow.create_quiz_feedback_workflow()
+
+
+@pytest.mark.parametrize("routes, max_missed, answers, expected", [
+    ({"perfect", "zero"}, 1, CORRECT, "perfect"),
+    ({"perfect", "zero"}, 1, WRONG, "zero"),
+    ({"perfect", "zero"}, 1, CORRECT[:4] + [3], "generate"),
+    ({"perfect", "zero", "partial"}, 1, CORRECT[:4] + [3], "partial"),
+    ({"perfect", "zero", "partial"}, 1, CORRECT[:3] + [3, 3], "generate"),
+    ({"partial"}, 5, WRONG, "generate"),
+    (set(), 1, CORRECT, "generate"),
+])
+def test_routing_decision_is_counted(monkeypatch, routes, max_missed, answers, expected):
+    monkeypatch.setattr(langgraph_workflow, "FEEDBACK_TEMPLATE_ROUTES", routes)
+    monkeypatch.setattr(langgraph_workflow, "FEEDBACK_TEMPLATE_MAX_MISSED", max_missed)
+    before = routing_stats().get(expected, 0)
+
+    next_node = route_feedback(analysed_state(answers))
+
+    assert next_node == ("generate_feedback" if expected == "generate" else "template_feedback")
+    assert routing_stats()[expected] == before + 1
+
+
+def test_empty_quiz_goes_to_generate():
+    state = {"quiz": Quiz(title="Pendulum Basics", questions=[]), "score": 0, "total_questions": 0}
+    assert route_feedback(state) == "generate_feedback"
+
+
+@pytest.mark.parametrize("answers, route, text", [
+    (CORRECT, "perfect", "Excellent — all 5 answers are correct. Well done!"),
+    (WRONG, "zero", "Score: 0/5. Review: definition of a simple pendulum and its assumptions"),
+])
+def test_template_route_skips_llm_and_guardrails(no_llm_no_guardrails, answers, route, text):
+    quiz = Quiz(title="Pendulum Basics",
+                questions=[Question(id=qid, user_answer=a) for qid, a in enumerate(answers, start=1)])
+
+    result = no_llm_no_guardrails.invoke({"quiz": quiz})
+
+    assert result["feedback"].startswith(text)
+    assert result["guardrail_check"] == "APPROVED"
+    assert result["per_quiz_summary"][0]["feedback_route"] == route
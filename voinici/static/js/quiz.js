@@ -1,12 +1,92 @@
 // Minimal frontend integration for QuizFeedbackEngine
 // - Fetches mock quiz from QuizFeedbackEngine running at http://localhost:5000
-// - Renders questions, captures answers, and POSTs compact attempt to /feedback/simple
+// - Renders questions, captures answers, and POSTs compact attempt to /feedback
+// - Streams answers over the /ws/quiz-session WebSocket so feedback is ready on Submit
 // - Shows feedback in the page
 
 // Backend endpoint for feedback. Browsers cannot connect to 0.0.0.0; use localhost instead.
 // If you need to point to a different host, set window.QFE_API_BASE before this script runs.
 const API_BASE = window.QFE_API_BASE || 'http://127.0.0.1:5000'; // change if your service runs elsewhere
 
+// Client-generated id for the current set of answers. Resubmitting unchanged answers (double click,
+// retry after an error) reuses it, so the backend returns the stored feedback instead of recomputing.
+let currentAttemptId = null;
+
+function newAttemptId() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return `${Date.now().toString(16)}-${Math.random().toString(16).slice(2)}`;
+}
+
+// Normalize title (remove parenthetical suffix like "(10 questions)")
+function quizTitle(quiz) {
+  return (quiz.title || '').split(' (')[0];
+}
+
+// Incremental session over WebSocket: each answer is sent as it is chosen so the backend can grade
+// as we go and prefetch feedback before Submit. Falls back to POST /feedback when unavailable.
+const WS_BASE = API_BASE.replace(/^http/, 'ws');
+let session = null;
+
+function openSession(quiz) {
+  if (!window.WebSocket) return;
+  let ws;
+  try {
+    ws = new WebSocket(`${WS_BASE}/ws/quiz-session`);
+  } catch (err) {
+    return;
+  }
+  const s = { ws, ready: false, pending: null };
+  ws.addEventListener('open', () => {
+    ws.send(JSON.stringify({ type: 'start', title: quizTitle(quiz) }));
+  });
+  ws.addEventListener('message', (ev) => {
+    let msg;
+    try { msg = JSON.parse(ev.data); } catch (err) { return; }
+    if (msg.type === 'ready') {
+      s.ready = true;
+      // replay answers chosen before the session was ready
+      quiz.questions.forEach((q, idx) => {
+        const checked = document.querySelector(`input[name="q_${idx}"]:checked`);
+        if (checked) sendAnswer(q.id, parseInt(checked.value, 10));
+      });
+    } else if (s.pending && (msg.type === 'feedback' || msg.type === 'error')) {
+      const { resolve, reject } = s.pending;
+      s.pending = null;
+      if (msg.type === 'feedback') resolve(msg.result); else reject(new Error('AI_UNAVAILABLE'));
+    }
+  });
+  const drop = () => {
+    if (s.pending) { s.pending.reject(new Error('SESSION_CLOSED')); s.pending = null; }
+    if (session === s) session = null;
+  };
+  ws.addEventListener('close', drop);
+  ws.addEventListener('error', drop);
+  session = s;
+}
+
+function sendAnswer(questionId, userAnswer) {
+  if (!session || !session.ready || session.ws.readyState !== WebSocket.OPEN) return;
+  session.ws.send(JSON.stringify({ type: 'answer', question_id: questionId, user_answer: userAnswer }));
+}
+
+function submitViaSession(timeoutMs = 30000) {
+  return new Promise((resolve, reject) => {
+    if (!session || !session.ready || session.ws.readyState !== WebSocket.OPEN) {
+      reject(new Error('NO_SESSION'));
+      return;
+    }
+    const timer = setTimeout(() => {
+      if (session && session.pending) session.pending = null;
+      reject(new Error('SESSION_TIMEOUT'));
+    }, timeoutMs);
+    session.pending = {
+      resolve: (r) => { clearTimeout(timer); resolve(r); },
+      reject: (e) => { clearTimeout(timer); reject(e); }
+    };
+    session.ws.send(JSON.stringify({ type: 'submit' }));
+  });
+}
+
 async function fetchQuiz() {
   // If a page embeds a quiz (window.__embeddedQuiz), prefer that for offline/standalone use.
   if (window.__embeddedQuiz) return window.__embeddedQuiz;
@@ -52,6 +132,9 @@ function renderQuiz(quiz) {
         // Add change handler to toggle selected class on the label
         const input = label.querySelector('input[type="radio"]');
         input.addEventListener('change', () => {
+          // answers changed: the next submit is a new attempt
+          currentAttemptId = null;
+          if (input.checked) sendAnswer(q.id, ai);
           // remove selected from other labels in this answersDiv
           answersDiv.querySelectorAll('label').forEach(l => l.classList.remove('selected'));
           if (input.checked) label.classList.add('selected');
@@ -104,10 +187,12 @@ function collectAttempt(quiz) {
   answers.push({ question_id: qid, user_answer: user_index });
   });
 
+  if (!currentAttemptId) currentAttemptId = newAttemptId();
+
   return {
-    // Normalize title (remove parenthetical suffix like "(10 questions)")
-    title: (quiz.title || '').split(' (')[0],
-    answers
+    title: quizTitle(quiz),
+    answers,
+    attempt_id: currentAttemptId
   };
 }
 
@@ -132,7 +217,7 @@ function validateAllAnswered(quiz) {
 async function submitAttempt(attempt) {
     const res = await fetch(`${API_BASE}/feedback`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: { 'Content-Type': 'application/json', 'Idempotency-Key': attempt.attempt_id },
       body: JSON.stringify(attempt)
     });
 
@@ -150,6 +235,7 @@ async function init() {
     const quiz = await fetchQuiz();
     window.__currentQuiz = quiz;
     renderQuiz(quiz);
+    openSession(quiz);
 
     document.getElementById('submit-btn').addEventListener('click', async () => {
       try {
@@ -173,7 +259,13 @@ async function init() {
         document.getElementById('submit-btn').disabled = true;
         document.getElementById('feedback').textContent = 'Submitting…';
         const attempt = collectAttempt(quiz);
-  const resp = await submitAttempt(attempt);
+  let resp;
+  try {
+    // prefetched feedback from the live session, if there is one
+    resp = await submitViaSession();
+  } catch (err) {
+    resp = await submitAttempt(attempt);
+  }
   // If backend returns an object with a 'feedback' field, show that; otherwise show the full response.
   const feedbackText = (resp && resp.feedback) ? resp.feedback : JSON.stringify(resp, null, 2);
   document.getElementById('feedback').textContent = feedbackText;
@@ -191,6 +283,10 @@ async function init() {
       form.querySelectorAll('input[type=radio]').forEach(r => r.checked = false);
       form.querySelectorAll('label').forEach(l => l.classList.remove('selected'));
       form.querySelectorAll('input[type=text]').forEach(i => i.value = '');
+      currentAttemptId = null;
+      // start a fresh session so the server forgets the cleared answers
+      if (session) session.ws.close();
+      openSession(quiz);
       document.getElementById('feedback').textContent = '(no feedback yet)';
     });
   } catch (err) {